@@ -0,0 +1,58 @@
+"""Check that the project modules import within their startup budget.
+
+Each module is imported in a fresh interpreter from its own project folder,
+as the notebooks do. The best of a few runs is compared with the budget, and
+packages that should only load on demand must not be in sys.modules after
+the import. Run with: python check_import_time.py
+"""
+import os
+import subprocess
+import sys
+
+# module: (project folder, budget in seconds, packages that must not be imported)
+BUDGETS = {
+    'inauguralproject': ('inauguralproject', 1.5, ()),
+    'dataproject': ('dataproject', 1.5, ('pandas_datareader', 'matplotlib', 'ipywidgets', 'matplotlib_venn', 'scipy.stats')),
+    'modelproject': ('modelproject', 1.0, ('sympy',)),
+    'problem1': ('examproject', 1.5, ()),
+    'problem2': ('examproject', 1.0, ('matplotlib',)),
+    'problem3': ('examproject', 1.0, ('matplotlib', 'scipy')),
+}
+
+REPEATS = 3
+
+SNIPPET = '''
+import sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+loaded = [name for name in {forbidden!r} if name in sys.modules]
+print(elapsed, ','.join(loaded))
+'''
+
+
+def measure(module, folder, forbidden):
+    """best import time over REPEATS fresh interpreters and the forbidden packages that were loaded"""
+    cwd = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder)
+    best, loaded = float('inf'), ''
+    for _ in range(REPEATS):
+        out = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module, forbidden=forbidden)],
+                             cwd=cwd, capture_output=True, text=True, check=True).stdout.split()
+        best = min(best, float(out[0]))
+        loaded = out[1] if len(out) > 1 else ''
+    return best, loaded
+
+
+def main():
+    failed = False
+    for module, (folder, budget, forbidden) in BUDGETS.items():
+        elapsed, loaded = measure(module, folder, forbidden)
+        ok = elapsed <= budget and not loaded
+        failed |= not ok
+        note = f', loaded {loaded}' if loaded else ''
+        print(f'{"ok  " if ok else "FAIL"} {module:18s} {elapsed:6.3f}s (budget {budget:.1f}s){note}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
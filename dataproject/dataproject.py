@@ -1,15 +1,116 @@
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import ipywidgets as widgets
-from matplotlib_venn import venn2
-from scipy import stats
-import pandas_datareader 
 import datetime
 
+# pandas_datareader and scipy.stats are imported inside the functions that use
+# them, plotting and widget packages are imported by the notebook
+
+# Columns computed by ppp_pct_diff, everything else in the ppp frame is input data
+DERIVED_COLUMNS = ['CA_pct_dif_from_USA_CPI', 'UK_pct_dif_from_USA_CPI', 'US-UK_exchange_rate_DIF', 'CAN-US_exchange_rate_DIF']
+
+# Country: (CPI column, exchange rate column in currency units per USD) in the frames from import_data/merge_outer
+COUNTRIES = {'USA': ('CPI_USA', None), 'UK': ('CPI_UK', 'US-UK_exchange_rate'), 'CA': ('CPI_CA', 'CAN-US_exchange_rate')}
+
+
+def _read_cache(path):
+    # Parquet file read through a memory map, so only the pages that are used are loaded
+    return pd.read_parquet(path, engine='pyarrow', memory_map=True)
+
+
+def _write_cache(df, path):
+    # Parquet file written next to the data, the index (DATE) is stored with the columns
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    df.to_parquet(path, engine='pyarrow')
+
+
+def _same_prefix(old, new):
+    # Number of leading rows where the index and all columns of old and new agree (NaN equals NaN)
+    n = min(len(old), len(new))
+    if n == 0 or list(old.columns) != list(new.columns):
+        return 0
+    a, b = old.iloc[:n], new.iloc[:n]
+    same = (a.index == b.index) & ((a.values == b.values) | (a.isna().values & b.isna().values)).all(axis=1)
+    return n if same.all() else int(np.argmin(same))
+
+class LocalSource:
+    # FRED-style series from local snapshot files, for offline and reproducible runs. path is either one
+    # wide CSV/Parquet file with a DATE column and one column per series code, or a directory with one
+    # file per series named <code>.csv or <code>.parquet (as downloaded from FRED)
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self, path, columns=None):
+        if path.endswith('.parquet'):
+            if columns is not None:
+                import pyarrow.parquet
+
+                # keep a date stored as a column, a date stored as the index is restored by pandas
+                names = pyarrow.parquet.read_schema(path).names
+                columns = [c for c in ('DATE', 'observation_date') if c in names] + list(columns)
+            df = pd.read_parquet(path, engine='pyarrow', columns=columns, memory_map=True)
+        else:
+            usecols = None if columns is None else lambda c: c in columns or c in ('DATE', 'observation_date')
+            df = pd.read_csv(path, usecols=usecols)
+        if 'DATE' not in df.columns and df.index.name != 'DATE':
+            df = df.rename(columns={'observation_date': 'DATE'})
+        if df.index.name != 'DATE':
+            df = df.set_index('DATE')
+        df.index = pd.to_datetime(df.index)
+        return df
+
+    def fetch(self, codes, start, end):
+        # All series in one pass: one read of the wide file, or one read per series file
+        if os.path.isdir(self.path):
+            frames = []
+            for code in codes:
+                path = os.path.join(self.path, code + '.parquet')
+                frames.append(self._read(path if os.path.exists(path) else os.path.join(self.path, code + '.csv')))
+            df = pd.concat(frames, axis=1, join='outer')
+        else:
+            df = self._read(self.path, columns=list(codes))
+        df = df.sort_index()
+        return df.loc[start:end, list(codes)]
+
+
+class FredSource:
+    # Series from the FRED API through pandas_datareader, with one HTTP session reused for every request
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self.session = None
+
+    def fetch(self, codes, start, end):
+        import pandas_datareader.data
+        import requests
+
+        if self.session is None:
+            self.session = requests.Session()
+        return pandas_datareader.data.DataReader(list(codes), 'fred', start, end, session=self.session, api_key=self.api_key)
+
+
+def save_snapshot(df, path):
+    # Write fetched series (DATE index, one column per code) as a snapshot that LocalSource can read
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        df.to_parquet(path, engine='pyarrow')
+    else:
+        df.to_csv(path, index_label='DATE')
+
+
 class dataproject:
-    def import_data():
-        #Importing data form FRED
+    def import_data(cache_dir=None, refresh=False, source=None):
+        # source is where the series come from, FredSource() by default or LocalSource(path) for snapshots.
+        # With cache_dir, the series are read from Parquet files there when they exist, so the
+        # analysis runs offline, and written there after a fetch (or when refresh=True)
+        if cache_dir is not None and not refresh:
+            paths = [os.path.join(cache_dir, name) for name in ('exchange.parquet', 'inflation.parquet')]
+            if all(os.path.exists(path) for path in paths):
+                return _read_cache(paths[0]), _read_cache(paths[1])
+
+        #Importing data form FRED, or the source that was passed in
+        source = FredSource() if source is None else source
 
         #CPI data (Growth rate previous period (year), Not Seasonally Adjusted)
         CPI_CAN = 'CPALTT01CAA657N'
@@ -27,16 +128,28 @@ class dataproject:
         end = datetime.datetime(2020,1,1)
         timespan = end - start # We can investigate the precise time span by just subtracting to time variables.
 
-        # Call the FRED api using pandas_datareader 
-        inflation = pandas_datareader.data.DataReader([CPI_USA, CPI_UK, CPI_CAN], 'fred', start, end)
+        # Load all series in one pass and split them into inflation and exchange rates
+        series = source.fetch([CPI_USA, CPI_UK, CPI_CAN, EX_UK, EX_CAN], start, end)
+        inflation = series[[CPI_USA, CPI_UK, CPI_CAN]].dropna(how='all')
         inflation = inflation.rename(columns = {'CPALTT01USA659N':'CPI_USA','CPALTT01GBA659N':'CPI_CA','CPALTT01CAA657N':'CPI_UK'})
 
-        # Call the FRED api using pandas_datareader 
-        exchange = pandas_datareader.data.DataReader([EX_UK, EX_CAN], 'fred', start, end)
+        exchange = series[[EX_UK, EX_CAN]].dropna(how='all')
         exchange = exchange.rename(columns = {'AEXUSUK':'US-UK_exchange_rate','AEXCAUS':'CAN-US_exchange_rate'})
         exchange['US-UK_exchange_rate'] = 1 / exchange['US-UK_exchange_rate']
 
+        if cache_dir is not None:
+            _write_cache(exchange, os.path.join(cache_dir, 'exchange.parquet'))
+            _write_cache(inflation, os.path.join(cache_dir, 'inflation.parquet'))
+
         return exchange, inflation
+
+    def load_csv(csv_path, cache_dir, **read_csv_kwargs):
+        # A local CSV such as dataX.csv, converted once to Parquet in cache_dir and read memory-mapped
+        # after that; the Parquet file is rebuilt when the CSV is newer
+        path = os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0] + '.parquet')
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+            _write_cache(pd.read_csv(csv_path, **read_csv_kwargs), path)
+        return _read_cache(path)
     
     def merge_outer(inflation, exchange):
 
@@ -44,17 +157,37 @@ class dataproject:
 
         return ppp
     
-    def ppp_pct_diff(ppp):
+    def ppp_pct_diff(ppp, cache=None):
+        # With cache, a Parquet file of an earlier result, the derived columns are only computed for the rows
+        # that are new or changed since then, and the cache is updated
+
+        # a. rows that can be taken from the cache, the first changed row needs the row before it for the diff
+        inputs = ppp.drop(columns=DERIVED_COLUMNS, errors='ignore')
+        n_keep = 0
+        if cache is not None and os.path.exists(cache):
+            old = _read_cache(cache)
+            n_keep = _same_prefix(old.drop(columns=DERIVED_COLUMNS), inputs)
+        start = max(n_keep - 1, 0)
+
+        # b. derived columns for the remaining rows
+        new = inputs.iloc[start:].copy()
+        new['CA_pct_dif_from_USA_CPI'] = ((new.CPI_CA-new.CPI_USA) / new.CPI_USA) *10 # the pct. difference between inflation in canada and USA
+        new['UK_pct_dif_from_USA_CPI'] = ((new.CPI_UK-new.CPI_USA) / new.CPI_USA) *10 #the pct. difference between inflation in UK and USA
+        new['US-UK_exchange_rate_DIF'] = (new['US-UK_exchange_rate'].diff() / new['US-UK_exchange_rate'].shift(1)) * 100 #tjek vejen
+        new['CAN-US_exchange_rate_DIF'] = (new['CAN-US_exchange_rate'].diff() / new['CAN-US_exchange_rate'].shift(1)) * 100 #tjek vejen
+
+        # c. put the cached and the new rows together in the frame that was passed in
+        derived = new[DERIVED_COLUMNS] if n_keep == 0 else pd.concat([old[DERIVED_COLUMNS].iloc[:n_keep], new[DERIVED_COLUMNS].iloc[1:]])
+        for column in DERIVED_COLUMNS:
+            ppp[column] = derived[column].values
 
-        ppp['CA_pct_dif_from_USA_CPI'] = ((ppp.CPI_CA-ppp.CPI_USA) / ppp.CPI_USA) *10 # the pct. difference between inflation in canada and USA
-        ppp['UK_pct_dif_from_USA_CPI'] = ((ppp.CPI_UK-ppp.CPI_USA) / ppp.CPI_USA) *10 #the pct. difference between inflation in UK and USA
-        ppp['US-UK_exchange_rate_DIF'] = (ppp['US-UK_exchange_rate'].diff() / ppp['US-UK_exchange_rate'].shift(1)) * 100 #tjek vejen
-        ppp['CAN-US_exchange_rate_DIF'] = (ppp['CAN-US_exchange_rate'].diff() / ppp['CAN-US_exchange_rate'].shift(1)) * 100 #tjek vejen
+        if cache is not None and n_keep < len(ppp):
+            _write_cache(ppp, cache)
 
         return ppp
     
     def filtered_ppp(ppp):
-
+        from scipy import stats
 
         # Calculate z-scores for each data point
         outlier_columns = ['CA_pct_dif_from_USA_CPI', 'UK_pct_dif_from_USA_CPI']
@@ -131,6 +264,55 @@ class dataproject:
         #print(mean_year_mean_UK_pct_dif_from_USA_CPI, mean_year_mean_CA_pct_dif_from_USA_CPI, mean_year_mean_US_UK_exchange_rate_DIF, mean_year_mean_CAN_US_exchange_rate_DIF)
 
 
+    def long_panel(ppp, countries=COUNTRIES):
+        # Long panel with columns DATE, country, cpi and fx (currency units per USD) from a wide ppp frame,
+        # the exchange rate of a country without one (the USA) is 1
+        frames = []
+        for country, (cpi, fx) in countries.items():
+            frames.append(pd.DataFrame({'DATE': ppp.index, 'country': country, 'cpi': ppp[cpi].values,
+                                        'fx': 1.0 if fx is None else ppp[fx].values}))
+        return pd.concat(frames, ignore_index=True)
+
+    def ppp_engine(panel, bases=None):
+        # Inflation differential and exchange rate change of every country against every base country in bases
+        # (all countries when None), for a long panel with columns DATE, country, cpi and fx in units per one
+        # common currency. The columns are scaled as in ppp_pct_diff, so CA against USA gives the same numbers.
+        # With N countries and all bases the result has N*(N-1) rows per date.
+        panel = panel[['DATE', 'country', 'cpi', 'fx']]
+        base_panel = panel if bases is None else panel[panel['country'].isin(bases)]
+
+        # a. all (country, base) pairs on the same date
+        pairs = panel.merge(base_panel.rename(columns={'country': 'base', 'cpi': 'cpi_base', 'fx': 'fx_base'}), on='DATE')
+        pairs = pairs[pairs['country'] != pairs['base']].sort_values(['country', 'base', 'DATE'], ignore_index=True)
+
+        # b. inflation differential and the change in the cross rate (country currency per base currency)
+        pairs['cpi_dif'] = (pairs['cpi'] - pairs['cpi_base']) / pairs['cpi_base'] * 10
+        pairs['fx_pair'] = pairs['fx'] / pairs['fx_base']
+        pairs['fx_change'] = pairs.groupby(['country', 'base'])['fx_pair'].pct_change(fill_method=None) * 100
+
+        return pairs[['DATE', 'country', 'base', 'cpi_dif', 'fx_change']]
+
+    def filter_outliers(pairs, columns=('cpi_dif',), threshold=3):
+        # Rows of ppp_engine output where the z-score of every column within its (country, base) pair is below threshold
+        groups = pairs.groupby(['country', 'base'])
+        keep = np.ones(len(pairs), dtype=bool)
+        for column in columns:
+            x = pairs[column]
+            z = (x - groups[column].transform('mean')) / groups[column].transform('std', ddof=0)
+            keep &= (z.abs() < threshold).values
+        return pairs[keep]
+
+    def window_average(pairs, freq='5YS', window=None):
+        # Means of ppp_engine output per (country, base) over calendar windows of freq (resample), or over a
+        # rolling window of observations or time such as 5 or '1825D' when window is given
+        if window is None:
+            # one grouped aggregation over all pairs and windows, not a resample per pair
+            windows = pairs.groupby(['country', 'base', pd.Grouper(key='DATE', freq=freq)])[['cpi_dif', 'fx_change']]
+            return windows.mean().reset_index()
+        groups = pairs.set_index('DATE').groupby(['country', 'base'])[['cpi_dif', 'fx_change']]
+        return groups.rolling(window, min_periods=1).mean().reset_index()
+
+
 def keep_regs(df, regs):
     """ Example function. Keep only the subset regs of regions in data.
 
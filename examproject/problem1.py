@@ -1,12 +1,118 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
 import numpy as np
 from types import SimpleNamespace
-from scipy import optimize
-from scipy.optimize import fsolve
 from scipy.optimize import minimize_scalar
 
+class ParameterSet(SimpleNamespace):
+    """model parameters, each a scalar or a broadcastable numpy array
+
+    replace() and grid() return modified copies and never change the original,
+    so one set of parameters can be shared safely between model instances.
+
+    Each project folder is imported on its own from its notebook, so the same
+    class is also defined in inauguralproject/inauguralproject.py and
+    modelproject/modelproject.py; keep the three copies identical."""
+
+    def replace(self,**kwargs):
+        """copy with the given entries replaced"""
+        new = ParameterSet(**vars(self))
+        for key, value in kwargs.items():
+            setattr(new,key,value)
+        return new
+
+    def grid(self,**kwargs):
+        """copy where each given array gets its own axis, e.g. grid(tau=taus,T=Ts) has shape (len(taus),len(Ts))"""
+        new = ParameterSet(**vars(self))
+        n = len(kwargs)
+        for i, (key, value) in enumerate(kwargs.items()):
+            shape = [1]*n
+            shape[i] = -1
+            setattr(new,key,np.asarray(value,dtype=float).reshape(shape))
+        return new
+
+    @property
+    def shape(self):
+        """broadcast shape of all array entries"""
+        return np.broadcast_shapes(*(value.shape for value in vars(self).values() if isinstance(value,np.ndarray)))
+
+class SolutionCache:
+    """LRU cache of solved models keyed on a hash of parameters and solver options
+
+    If path is given, entries are also pickled to that directory so they
+    survive restarts. hits, disk_hits and misses count lookups.
+
+    Each project folder is imported on its own from its notebook, so the same
+    class is also defined in inauguralproject/inauguralproject.py; keep the two copies identical."""
+
+    def __init__(self, maxsize=128, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, name, par, names, **options):
+        """hash of the method name, the parameters in names and the solver options"""
+        h = hashlib.sha256(name.encode())
+        for key, value in [(n, getattr(par, n)) for n in names] + sorted(options.items()):
+            value = np.asarray(value)
+            h.update(f'{key}:{value.dtype}:{value.shape}:'.encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        return h.hexdigest()
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) on a miss"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+
+        if self.path is not None:
+            filename = os.path.join(self.path, f'{key}.pkl')
+            if os.path.exists(filename):
+                with open(filename, 'rb') as f:
+                    value = pickle.load(f)
+                self._store(key, value)
+                self.disk_hits += 1
+                return True, value
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.path is not None:
+            filename = os.path.join(self.path, f'{key}.pkl')
+            with open(filename + '.tmp', 'wb') as f:
+                pickle.dump(value, f)
+            os.replace(filename + '.tmp', filename)
+
+    def _store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """empty the memory tier and reset the counters, files on disk are kept"""
+        self.entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
 class ProductionEconomyClass:
+    # solutions shared by all instances, replace to resize or add a disk tier
+    cache = SolutionCache()
+    cache_par = ('A', 'gamma', 'alpha', 'nu', 'epsilon', 'tau', 'T', 'kappa')
+
     def __init__(self):
-        self.par = SimpleNamespace()
+        self.par = ParameterSet()
 
         # Parameters initialization
         self.par.A = 1.0
@@ -18,27 +124,70 @@ class ProductionEconomyClass:
         self.par.T = 0.0
         self.par.kappa = 0.1
 
+    def with_par(self, **kwargs):
+        """new economy with some parameters replaced, this economy is left unchanged"""
+        model = type(self)()
+        model.par = self.par.replace(**kwargs)
+        return model
+
     def utility(self, c1, c2, l):
         """utility for consumer"""
         par = self.par
         return np.log(c1 ** par.alpha * c2 ** (1 - par.alpha)) - par.nu * l**(1 + par.epsilon) / (1 + par.epsilon)
 
+    def labor_supply(self, w, income):
+        """optimal labor supply for wage w and non-labor income, works on arrays
+
+        With log utility over c1 and c2 the first-order condition is
+        nu*l**epsilon*(w*l + income) = w. It is solved in closed form for
+        epsilon = 1 and otherwise by Newton steps safeguarded by bisection on
+        [0, 1], all elements at once."""
+        par = self.par
+        w, income, nu, epsilon = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (w, income, par.nu, par.epsilon)))
+
+        def foc(l):
+            return nu * l**epsilon * (w * l + income) - w
+
+        # a. closed form: nu*w*l**2 + nu*income*l - w = 0
+        if np.all(epsilon == 1):
+            l = (-nu * income + np.sqrt((nu * income)**2 + 4 * nu * w * w)) / (2 * nu * w)
+            return np.clip(l, 0, 1)
+
+        # b. batched Newton-bisection, foc is increasing in l
+        lo = np.zeros(w.shape)
+        hi = np.ones(w.shape)
+        l = np.full(w.shape, 0.5)
+        for _ in range(100):
+            g = foc(l)
+            lo = np.where(g < 0, l, lo)
+            hi = np.where(g > 0, l, hi)
+
+            dg = nu * (epsilon * l**(epsilon - 1) * (w * l + income) + l**epsilon * w)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                l_new = l - g / dg
+            inside = (l_new > lo) & (l_new < hi)
+            l_new = np.where(inside, l_new, (lo + hi) / 2)
+
+            if np.all(np.abs(l_new - l) < 1e-14):
+                l = l_new
+                break
+            l = l_new
+
+        # c. corner at l = 1 if the first-order condition is negative there
+        return np.where(foc(np.ones(w.shape)) <= 0, 1.0, l)
+
     def consumer(self, p_1, p_2, w):
-        """maximize utility for consumer"""
+        """maximize utility for consumer, p_1, p_2 and w may be arrays"""
         par = self.par
 
         # Calculate profit terms pi_1 and pi_2
         pi_1 = ((1 - par.gamma) / par.gamma) * w * ((p_1 * par.A * par.gamma) / w) ** (1 / (1 - par.gamma))
         pi_2 = ((1 - par.gamma) / par.gamma) * w * ((p_2 * par.A * par.gamma) / w) ** (1 / (1 - par.gamma))
 
-        def obj(l):
-            c1 = par.alpha * (w * l + par.T + pi_1 + pi_2) / p_1
-            c2 = (1 - par.alpha) * (w * l + par.T + pi_1 + pi_2) / (p_2 + par.tau)  # Corrected line
-            return -self.utility(c1, c2, l)
-
         # Optimize labor supply
-        res = optimize.minimize_scalar(obj, bounds=(0, 1), method='bounded')
-        l_star_c = res.x
+        l_star_c = self.labor_supply(w, par.T + pi_1 + pi_2)
+        if l_star_c.ndim == 0:
+            l_star_c = float(l_star_c)
         c1_star_c = par.alpha * (w * l_star_c + par.T + pi_1 + pi_2) / p_1
         c2_star_c = (1 - par.alpha) * (w * l_star_c + par.T + pi_1 + pi_2) / (p_2 + par.tau)
         
@@ -83,61 +232,264 @@ class ProductionEconomyClass:
             l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p_2, w)
             print(f'p_2 = {p_2:.2f} -> l_star_f2 = {l_star_f2:.2f}, y_star_f2 = {y_star_f2:.2f}, pi_stat_f2 = {pi_star_f2:.2f}')
 
-    def market_clearing(self):
-        # Check market clearing conditions
-        par = self.par 
-        w = 1  # Numeraire
+    def excess_demand(self, p_1, p_2, w=1.0, supply=False):
+        """excess demand for good 1, good 2 and labor, p_1, p_2 and w may be arrays
+
+        With supply=True the supplied quantities (y1, y2 and the consumer's
+        labor) are returned as well, for tolerances relative to them."""
+        c1_star_c, c2_star_c, l_star_c = self.consumer(p_1, p_2, w)
+        l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(p_1, w)
+        l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p_2, w)
+
+        z1 = c1_star_c - y_star_f1
+        z2 = c2_star_c - y_star_f2
+        z_labor = l_star_f1 + l_star_f2 - l_star_c
 
+        if supply:
+            return z1, z2, z_labor, (y_star_f1, y_star_f2, l_star_c)
+        return z1, z2, z_labor
+
+    def market_clearing(self, p1_range=None, p2_range=None, w=1, chunk_size=200, rtol=1e-05, atol=1e-08, do_print=False):
+        """excess demand surfaces on the grid p1_range x p2_range
+
+        The grid is evaluated in blocks of chunk_size values of p1 so memory
+        stays bounded for fine grids. A market clears where consumption and
+        production are np.isclose with the given tolerances."""
         # Price ranges
-        p1_range = np.linspace(0.1, 2.0, 10)
-        p2_range = np.linspace(0.1, 2.0, 10)
-
-        market_clearing_results = []
-
-        for p1 in p1_range:
-            for p2 in p2_range:
-                c1_star_c, c2_star_c, l_star_c = self.consumer(p1, p2, w)
-                l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(p1, w)
-                l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p2, w)
-                
-                # Market clearing conditions
-                market_clearing_y1 = np.isclose(y_star_f1, c1_star_c)
-                market_clearing_y2 = np.isclose(y_star_f2, c2_star_c)
-                
-                market_clearing_results.append((p1, p2, market_clearing_y1, market_clearing_y2))
+        p1_range = np.linspace(0.1, 2.0, 10) if p1_range is None else np.asarray(p1_range, dtype=float)
+        p2_range = np.linspace(0.1, 2.0, 10) if p2_range is None else np.asarray(p2_range, dtype=float)
+
+        shape = (p1_range.size, p2_range.size)
+        res = SimpleNamespace(p1=p1_range, p2=p2_range)
+        res.z1, res.z2, res.z_labor = np.empty(shape), np.empty(shape), np.empty(shape)
+        res.clear_1, res.clear_2, res.clear_labor = np.empty(shape, dtype=bool), np.empty(shape, dtype=bool), np.empty(shape, dtype=bool)
+
+        for start in range(0, p1_range.size, chunk_size):
+            rows = slice(start, start + chunk_size)
+            p1 = p1_range[rows, np.newaxis]
+            p2 = p2_range[np.newaxis, :]
+
+            z1, z2, z_labor, (y1, y2, l_c) = self.excess_demand(p1, p2, w, supply=True)
+
+            # Market clearing conditions: supply is close to demand = supply + excess demand
+            res.z1[rows], res.z2[rows], res.z_labor[rows] = z1, z2, z_labor
+            res.clear_1[rows] = np.isclose(y1, y1 + z1, rtol=rtol, atol=atol)
+            res.clear_2[rows] = np.isclose(y2, y2 + z2, rtol=rtol, atol=atol)
+            res.clear_labor[rows] = np.isclose(l_c + z_labor, l_c, rtol=rtol, atol=atol)
 
         # Display results
-        print("p1\tp2\tMarket Clearing for Good 1\tMarket Clearing for Good 2")
-        for result in market_clearing_results:
-            p1, p2, market_clearing_y1, market_clearing_y2 = result
-            print(f"{p1:.2f}\t{p2:.2f}\t{market_clearing_y1}\t\t\t{market_clearing_y2}")
+        if do_print:
+            print("p1\tp2\tMarket Clearing for Good 1\tMarket Clearing for Good 2")
+            for i, p1 in enumerate(p1_range):
+                for j, p2 in enumerate(p2_range):
+                    print(f"{p1:.2f}\t{p2:.2f}\t{res.clear_1[i, j]}\t\t\t{res.clear_2[i, j]}")
+
+        return res
+
+    def refine_market_clearing(self, p1_range=None, p2_range=None, levels=4, n=21, max_cells=10, w=1):
+        """candidate equilibrium prices by zooming in on sign changes
+
+        Starting from the market_clearing grid, cells where both z1 and z2
+        change sign are re-gridded with n x n points, levels times, keeping at
+        most max_cells cells per level. Returns the best grid point of each
+        final cell, ordered by |z1| + |z2|, as starting points for a root finder."""
+
+        def bracketing_boxes(res):
+            # cells whose four corners contain both signs of z1 and of z2
+            brackets = []
+            size = 0
+            for z in (res.z1, res.z2):
+                corners = np.stack([z[:-1, :-1], z[1:, :-1], z[:-1, 1:], z[1:, 1:]])
+                brackets.append((corners.min(axis=0) <= 0) & (corners.max(axis=0) >= 0))
+                size = size + np.abs(corners).mean(axis=0)
+            i, j = np.nonzero(brackets[0] & brackets[1])
+            return [(size[i[k], j[k]], (res.p1[i[k]], res.p1[i[k] + 1], res.p2[j[k]], res.p2[j[k] + 1])) for k in range(i.size)]
+
+        def best_boxes(candidates):
+            candidates.sort(key=lambda candidate: candidate[0])
+            return [box for size, box in candidates[:max_cells]]
+
+        boxes = best_boxes(bracketing_boxes(self.market_clearing(p1_range, p2_range, w=w)))
+        for level in range(levels):
+            candidates = []
+            for box in boxes:
+                res = self.market_clearing(np.linspace(box[0], box[1], n), np.linspace(box[2], box[3], n), w=w)
+                candidates += bracketing_boxes(res)
+            if not candidates:
+                break
+            boxes = best_boxes(candidates)
+
+        # best corner of each final box
+        p1_star = np.array([[box[0], box[1], box[0], box[1]] for box in boxes]).reshape(-1, 4)
+        p2_star = np.array([[box[2], box[2], box[3], box[3]] for box in boxes]).reshape(-1, 4)
+        z1, z2, z_labor = self.excess_demand(p1_star, p2_star, w)
+        k = np.argmin(np.abs(z1) + np.abs(z2), axis=1)
+        rows = np.arange(len(boxes))
+        p1_star, p2_star, z1, z2, z_labor = (x[rows, k] for x in (p1_star, p2_star, z1, z2, z_labor))
+
+        # neighbouring boxes share corners, keep each point once
+        unique = np.unique(np.stack([p1_star, p2_star], axis=1), axis=0, return_index=True)[1]
+        order = unique[np.argsort(np.abs(z1[unique]) + np.abs(z2[unique]))]
+        return SimpleNamespace(p1=p1_star[order], p2=p2_star[order], z1=z1[order], z2=z2[order], z_labor=z_labor[order])
+
+    def goods_residual(self, p_1, p_2, w=1.0):
+        """goods market residuals y - c and their analytic Jacobian w.r.t. (p_1, p_2)
+
+        Uses Hotelling's lemma (d pi_j / d p_j = y_j) and the implicit function
+        theorem on the labor supply first-order condition. Works on arrays."""
+        par = self.par
+        gamma = par.gamma
+
+        # a. firms
+        l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(p_1, w)
+        l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p_2, w)
+        dy1_dp1 = gamma * y_star_f1 / ((1 - gamma) * p_1)
+        dy2_dp2 = gamma * y_star_f2 / ((1 - gamma) * p_2)
+
+        # b. consumer
+        income = par.T + pi_star_f1 + pi_star_f2
+        l_star_c = self.labor_supply(w, income)
+        dfoc_dl = par.nu * (par.epsilon * l_star_c**(par.epsilon - 1) * (w * l_star_c + income) + l_star_c**par.epsilon * w)
+        dl_dincome = np.where(l_star_c < 1, -par.nu * l_star_c**par.epsilon / dfoc_dl, 0.0)
+        I = w * l_star_c + income
+        dI_dincome = 1 + w * dl_dincome
+        dI_dp1 = dI_dincome * y_star_f1
+        dI_dp2 = dI_dincome * y_star_f2
+
+        c1_star_c = par.alpha * I / p_1
+        c2_star_c = (1 - par.alpha) * I / (p_2 + par.tau)
+
+        # c. residuals and Jacobian
+        r1 = y_star_f1 - c1_star_c
+        r2 = y_star_f2 - c2_star_c
+        J11 = dy1_dp1 - par.alpha * (dI_dp1 / p_1 - I / p_1**2)
+        J12 = -par.alpha * dI_dp2 / p_1
+        J21 = -(1 - par.alpha) * dI_dp1 / (p_2 + par.tau)
+        J22 = dy2_dp2 - (1 - par.alpha) * (dI_dp2 / (p_2 + par.tau) - I / (p_2 + par.tau)**2)
+
+        return r1, r2, (J11, J12, J21, J22)
+
+    def solve_equilibrium(self, guess=None, w=1.0, tol=1e-12, maxiter=50):
+        """equilibrium prices by Newton's method with the analytic Jacobian
+
+        All parameters in par may be arrays, every element is solved at once.
+        Without a guess the previous solution of this instance is used (warm
+        start) and otherwise p1 = p2 = 1. Steps are halved until the residual
+        norm decreases and prices stay positive."""
+        par = self.par
+
+        # a. starting point
+        warm = hasattr(self, 'eq') and np.shape(self.eq.p1) in ((), par.shape) and np.all(self.eq.converged)
+        if guess is None:
+            guess = (self.eq.p1, self.eq.p2) if warm else (1.0, 1.0)
+        shape = np.broadcast_shapes(par.shape, np.shape(guess[0]), np.shape(guess[1]))
+        p_1 = np.broadcast_to(np.asarray(guess[0], dtype=float), shape).copy()
+        p_2 = np.broadcast_to(np.asarray(guess[1], dtype=float), shape).copy()
+
+        r1, r2, J = self.goods_residual(p_1, p_2, w)
+        norm = np.hypot(r1, r2)
+        backtracks = 0
+        it = 0
+
+        for it in range(maxiter):
+            converged = norm < tol
+            if np.all(converged):
+                break
+
+            # b. Newton direction from the 2x2 system (Cramer's rule)
+            J11, J12, J21, J22 = J
+            det = J11 * J22 - J12 * J21
+            dp1 = -(J22 * r1 - J12 * r2) / det
+            dp2 = -(-J21 * r1 + J11 * r2) / det
+
+            # c. backtracking
+            step = np.where(converged, 0.0, 1.0)
+            for _ in range(30):
+                p1_new = p_1 + step * dp1
+                p2_new = p_2 + step * dp2
+                positive = (p1_new > 0) & (p2_new > 0)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    r1_new, r2_new, J_new = self.goods_residual(np.where(positive, p1_new, p_1), np.where(positive, p2_new, p_2), w)
+                norm_new = np.hypot(r1_new, r2_new)
+                ok = converged | (positive & (norm_new < norm))
+                if np.all(ok):
+                    break
+                step = np.where(ok, step, step / 2)
+                backtracks += 1
+
+            update = ok & ~converged
+            p_1 = np.where(update, p1_new, p_1)
+            p_2 = np.where(update, p2_new, p_2)
+            r1 = np.where(update, r1_new, r1)
+            r2 = np.where(update, r2_new, r2)
+            J = tuple(np.where(update, new, old) for new, old in zip(J_new, J))
+            norm = np.hypot(r1, r2)
+
+            # stuck elements (no decrease found) are left as they are
+            if not np.any(update):
+                break
+
+        converged = norm < tol
+        self.eq = SimpleNamespace(p1=p_1, p2=p_2, r1=r1, r2=r2, converged=converged, iterations=it, backtracks=backtracks)
+        return self.eq
+
+    def equilibrium_path(self, guess=None, w=1.0, tol=1e-12, maxiter=50, chunk_size=1000, **paths):
+        """equilibria along a path of parameters by continuation
+
+        paths gives equally long sequences of parameter values, e.g.
+        equilibrium_path(tau=taus, T=Ts). The path is solved in batches of
+        chunk_size points, each warm-started from the last solution of the
+        previous batch. Points that do not converge are re-solved one by one
+        from the solution at the preceding point."""
+        names = list(paths)
+        values = [np.asarray(paths[name], dtype=float) for name in names]
+        n = values[0].size
+
+        res = SimpleNamespace(p1=np.empty(n), p2=np.empty(n), converged=np.empty(n, dtype=bool), iterations=np.empty(n, dtype=int))
+        model = self.with_par()
+
+        # a. batches warm-started from the end of the previous batch
+        for start in range(0, n, chunk_size):
+            rows = slice(start, start + chunk_size)
+            model.par = self.par.replace(**{name: value[rows] for name, value in zip(names, values)})
+            eq = model.solve_equilibrium(guess, w=w, tol=tol, maxiter=maxiter)
+            res.p1[rows], res.p2[rows], res.converged[rows] = eq.p1, eq.p2, eq.converged
+            res.iterations[rows] = eq.iterations
+            if np.any(eq.converged):
+                last = np.nonzero(eq.converged)[0][-1]
+                guess = (eq.p1[last], eq.p2[last])
+
+        # b. sequential continuation for the points that failed
+        for k in np.nonzero(~res.converged)[0]:
+            model.par = self.par.replace(**{name: value[k] for name, value in zip(names, values)})
+            neighbour = (res.p1[k - 1], res.p2[k - 1]) if k > 0 and res.converged[k - 1] else None
+            eq = model.solve_equilibrium(neighbour, w=w, tol=tol, maxiter=maxiter)
+            res.p1[k], res.p2[k], res.converged[k], res.iterations[k] = eq.p1, eq.p2, eq.converged, eq.iterations
+
+        return res
 
     def equilibrium(self):
         # Find equilibrium prices
         par = self.par 
         w = 1
 
-        # Market clearing conditions
-        def equlibrium(prices):
-            p_1, p_2 = prices
-            c1_star_c, c2_star_c, l_star_c = self.consumer(p_1, p_2, w)
-            l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(p_1, w)
-            l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p_2, w)
-            
-            # Market clearing conditions
-            market_clearing_y1 = y_star_f1 - c1_star_c
-            market_clearing_y2 = y_star_f2 - c2_star_c
-            
-            return [market_clearing_y1, market_clearing_y2]
-
-        # Initial guess for prices
-        initial_guess = [0.1, 0.1]
-
-        # Solve for equilibrium prices
-        equilibrium_prices = fsolve(equlibrium, initial_guess)
-        p1_eq, p2_eq = equilibrium_prices
+        key = self.cache.key(f'{type(self).__qualname__}.equilibrium', par, self.cache_par)
+        found, value = self.cache.get(key)
+        if found:
+            p1_eq, p2_eq = value
+            print(f"Equilibrium price for good 1: {p1_eq}")
+            print(f"Equilibrium price for good 2: {p2_eq}")
+            return p1_eq, p2_eq
+
+        # Solve for equilibrium prices with the analytic Jacobian
+        eq = self.solve_equilibrium(w=w)
+        if not np.all(eq.converged):
+            raise RuntimeError("Equilibrium was not found")
+        p1_eq, p2_eq = float(eq.p1), float(eq.p2)
+        self.cache.put(key, (p1_eq, p2_eq))
         print(f"Equilibrium price for good 1: {p1_eq}")
         print(f"Equilibrium price for good 2: {p2_eq}")
+        return p1_eq, p2_eq
     
     def check_specific_prices(self):
         w = 1.0
@@ -158,42 +510,101 @@ class ProductionEconomyClass:
                     print(f'p_1 = {p_1:.4f}, p_2 = {p_2:.4f} -> clear_market_1 = {clear_market_1:.10f} -> clear_market_2 = {clear_market_2:.10f} -> clear_labor_market = {clear_labor_market:.10f}')
 
     
-    def social_planner(self):
+    def government_equilibrium(self, tau, guess=None, w=1.0, tol=1e-12, maxiter=100):
+        """equilibrium for tax tau with the government budget T = tau*c2 enforced
+
+        tau may be an array. For each T the goods markets are cleared by
+        solve_equilibrium, warm-started from the previous prices, and T is
+        updated by secant steps on T - tau*c2 (a plain fixed-point step on the
+        first iteration). guess is an optional (p1, p2, T) starting point."""
+        par = self.par
+        tau = np.asarray(tau, dtype=float)
+
+        # a. starting point
+        p_1, p_2, T = (1.0, 1.0, 0.0) if guess is None else guess
+        p_1, p_2, T = (np.broadcast_to(np.asarray(x, dtype=float), tau.shape).copy() for x in (p_1, p_2, T))
+
+        model = self.with_par(tau=tau, T=T)
+        c1_star_c, c2_star_c, l_star_c = model.consumer(p_1, p_2, w)
+        converged = np.zeros(tau.shape, dtype=bool)
+        T_prev = g_prev = None
+        it = 0
+        for it in range(maxiter):
+
+            # b. inner equilibrium given T
+            model.par = model.par.replace(T=T)
+            eq = model.solve_equilibrium((p_1, p_2), w=w, tol=tol)
+            p_1, p_2 = eq.p1, eq.p2
+            c1_star_c, c2_star_c, l_star_c = model.consumer(p_1, p_2, w)
+
+            # c. government budget
+            g = T - tau * c2_star_c
+            converged = (np.abs(g) < tol) & eq.converged
+            if np.all(converged):
+                break
+
+            T_new = tau * c2_star_c
+            if g_prev is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    T_secant = T - g * (T - T_prev) / (g - g_prev)
+                T_new = np.where(np.isfinite(T_secant) & (g != g_prev), T_secant, T_new)
+            T_prev, g_prev = T, g
+            T = np.where(converged, T, T_new)
+
+        # d. welfare net of the externality from good 2
+        l_star_f2, y_star_f2, pi_star_f2 = model.firm_2(p_2, w)
+        u = model.utility(c1_star_c, c2_star_c, l_star_c)
+        welfare = u - par.kappa * y_star_f2
+
+        return SimpleNamespace(tau=tau, p1=p_1, p2=p_2, T=T, c1=c1_star_c, c2=c2_star_c, l=l_star_c, y2=y_star_f2,
+                               utility=u, welfare=welfare, converged=converged, iterations=it)
+
+    def social_planner(self, bounds=(0, 1), xatol=1e-8, do_print=True):
+        """welfare maximizing tau with T = tau*c2 and cleared markets for every candidate
+
+        Inner solutions are memoized by tau and each new candidate is
+        warm-started from the solution at the nearest tau already solved.
+        Raises RuntimeError if an inner equilibrium or the optimization fails;
+        only successful results are cached."""
         par = self.par
         w = 1.0
-        
-        def social_welfare(tau, par):
-            p1 = 1
-            p2 = 1
-            # Calculate c2_star_c within the social_welfare function
-            c1_star_c, c2_star_c, l_star_c = self.consumer(p1, p2, w)
-            T = tau * c2_star_c  # Update T based on c2_star_c
-            l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(p1, w)
-            l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(p1, w)
-            u = np.log(c1_star_c**par.alpha * c2_star_c**(1 - par.alpha)) - par.nu * l_star_c**(1 + par.epsilon) / (1 + par.epsilon)
-            return -(u - par.kappa * y_star_f2)  # Negate for minimization
-        
-        # Initial guess for c2 to estimate T
-        par.tau = 0.1
-        par.T = 0.1 * 0.5
-        l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(1, w)
-        l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(1, w)
-        c1_star_c, c2_star_c, l_star_c = self.consumer(1, 1, w)
-        u = np.log(c1_star_c**par.alpha * c2_star_c**(1 - par.alpha)) - par.nu * l_star_c**(1 + par.epsilon) / (1 + par.epsilon)
+
+        key = self.cache.key(f'{type(self).__qualname__}.social_planner', par, ('A', 'gamma', 'alpha', 'nu', 'epsilon', 'kappa'), bounds=bounds, xatol=xatol)
+        found, value = self.cache.get(key)
+        if found:
+            optimal_tau, optimal_T = value
+            if do_print:
+                print(f"Optimal tau: {optimal_tau}")
+                print(f"Optimal T: {optimal_T}")
+            return optimal_tau, optimal_T
+
+        solved = {}
+
+        def inner(tau):
+            tau = float(tau)
+            if tau not in solved:
+                guess = None
+                if solved:
+                    nearest = solved[min(solved, key=lambda t: abs(t - tau))]
+                    guess = (nearest.p1, nearest.p2, nearest.T)
+                solved[tau] = self.government_equilibrium(tau, guess, w=w)
+                if not np.all(solved[tau].converged):
+                    raise RuntimeError(f"Government equilibrium was not found for tau = {tau}")
+            return solved[tau]
+
+        def social_welfare(tau):
+            return -float(inner(tau).welfare)  # Negate for minimization
 
         # Optimize tau to maximize social welfare
-        result = minimize_scalar(lambda tau: social_welfare(tau, par), bounds=(0, 1), method='bounded')
-        optimal_tau = result.x
-
-        # Calculate T based on optimal tau
-        par.tau = optimal_tau
-        par.T = optimal_tau * c2_star_c
-        l_star_f1, y_star_f1, pi_star_f1 = self.firm_1(1, w)
-        l_star_f2, y_star_f2, pi_star_f2 = self.firm_2(1, w)
-        c1_star_c, c2_star_c, l_star_c = self.consumer(1, 1, w)
-        u = np.log(c1_star_c**par.alpha * c2_star_c**(1 - par.alpha)) - par.nu * l_star_c**(1 + par.epsilon) / (1 + par.epsilon)
-        optimal_T = optimal_tau * c2_star_c
-
-        print(f"Optimal tau: {optimal_tau}")
-        print(f"Optimal T: {optimal_T}")
-            
+        result = minimize_scalar(social_welfare, bounds=bounds, method='bounded', options={'xatol': xatol})
+        if not result.success:
+            raise RuntimeError(f"Optimal tau was not found: {result.message}")
+        optimal = inner(result.x)
+        optimal_tau = float(optimal.tau)
+        optimal_T = float(optimal.T)
+        self.cache.put(key, (optimal_tau, optimal_T))
+
+        if do_print:
+            print(f"Optimal tau: {optimal_tau}")
+            print(f"Optimal T: {optimal_T}")
+        return optimal_tau, optimal_T
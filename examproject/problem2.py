@@ -1,5 +1,10 @@
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+
 import numpy as np 
-import matplotlib.pyplot as plt
+
+# matplotlib is imported inside the plotting functions, so batch runs of the simulations do not load it
 
 ####Question 1
 
@@ -8,196 +13,294 @@ def calculate_utility(par):
     # Generate epsilon for all career tracks
     epsilon = np.random.normal(0, par.sigma, (par.K, par.J))
     
-    # Initialize array to store expected utilities
-    expected_utilities = np.zeros(par.J)
-    realised_utilities = np.zeros(par.J)
-    
-    # Iterate over each career track
-    for j in range(par.J):
-        v_j = par.v[j]  # Value associated with career track j
-        
-        # Calculate expected utility using simulation
-        expected_utility = v_j + np.mean(epsilon[:, j])
-        expected_utilities[j] = expected_utility
-        
-        # Calculate average realised utility
-        realised_utility = np.mean(v_j + epsilon[:, j])
-        realised_utilities[j] = realised_utility
+    # Expected utility and average realised utility for all career tracks at once
+    expected_utilities = par.v + np.mean(epsilon, axis=0)
+    realised_utilities = np.mean(par.v + epsilon, axis=0)
 
     return expected_utilities, realised_utilities
 
+# Function to draw K standard normals for J careers, as n_rep independent replications for QMC
+def _standard_normals(K, J, method, rng, n_rep):
+    if method == 'sobol':
+        from scipy.stats import norm, qmc
+        
+        # a. scrambled Sobol points need a power of 2 (at least 2) per replication, so the draws are
+        #    n_rep*2**m <= K, with fewer replications if K < 2*n_rep (the K in the result is the actual count)
+        n_rep = min(n_rep, K // 2)
+        if n_rep < 2:
+            raise ValueError('sobol needs K >= 4 for two replications of two points')
+        m = int(np.log2(K // n_rep))
+        u = np.stack([qmc.Sobol(d=J, scramble=True, seed=rng).random_base2(m) for _ in range(n_rep)])
+        return norm.ppf(u)
+    if method == 'antithetic':
+        z = rng.standard_normal(((K + 1) // 2, J))
+        return np.stack([z, -z])
+    return rng.standard_normal((K, J))
 
-####Question 2
+# Function to estimate E[func(v_j + epsilon_j)] for all careers and parameter sets with a standard error
+def estimate_utility(par, K=None, method='mc', func=None, seed=2021, n_rep=16):
+    # method is 'mc', 'antithetic', 'sobol' (randomized QMC with n_rep scrambles) or 'control'
+    # (epsilon, with known mean 0, as control variate). par.v has shape (..., J) and par.sigma
+    # broadcasts against the leading dimensions, so many parameter sets share the same draws.
+    K = par.K if K is None else K
+    func = (lambda u: u) if func is None else func
+    v = np.asarray(par.v, dtype=float)
+    sigma = np.asarray(par.sigma, dtype=float)
+    sigma = sigma[..., None] if sigma.ndim > 0 else sigma
+    J = v.shape[-1]
+    rng = np.random.default_rng(seed)
+    
+    # a. standard normal draws and the utilities they imply, draws first and careers last
+    z = _standard_normals(K, J, method, rng, n_rep)
+    shape = np.broadcast_shapes(v.shape, np.shape(sigma))
+    z = z.reshape(z.shape[:-1] + (1,) * (len(shape) - 1) + (J,))
+    utilities = func(v + sigma * z)
+    
+    # b. estimate and standard error for each method
+    if method == 'mc':
+        samples = utilities
+    elif method == 'antithetic':
+        samples = utilities.mean(axis=0)  # average of each antithetic pair
+    elif method == 'sobol':
+        samples = utilities.mean(axis=1)  # one estimate per scramble
+    elif method == 'control':
+        control = np.broadcast_to(z, utilities.shape)
+        centered = control - control.mean(axis=0)
+        beta = np.mean((utilities - utilities.mean(axis=0)) * centered, axis=0) / np.mean(centered**2, axis=0)
+        samples = utilities - beta * control  # the control has known mean 0
+    else:
+        raise ValueError(f'unknown method {method!r}')
+    
+    n = samples.shape[0]
+    return SimpleNamespace(expected=samples.mean(axis=0),
+                           se=samples.std(axis=0, ddof=1) / np.sqrt(n),
+                           K=utilities.shape[0] * (utilities.shape[1] if method in ('antithetic', 'sobol') else 1),
+                           method=method)
 
-# Function to simulate the scenario and calculate required metrics
-def simulate_and_visualize(par):
-    np.random.seed(2021)
-    
-    # Initialize arrays to store results
-    chosen_careers = np.zeros((par.N, par.K), dtype=int)
-    prior_expectations = np.zeros((par.N, par.K))
-    realized_utilities = np.zeros((par.N, par.K))
-    
-    for k in range(par.K):
-        for i in range(par.N):
-            F_i = par.F[i]
-            
-            # Draw noise terms for friends and self
-            epsilon_friends = np.random.normal(0, par.sigma, (par.J, F_i)) 
-            epsilon_self = np.random.normal(0, par.sigma, par.J)
-            #print(epsilon_friends)
-            
-            # Calculate prior expected utility for each career
-            prior_expected_utility = par.v + np.mean(epsilon_friends, axis=1) #axis=0
-            #print(prior_expected_utility)   
-            
-            # Choose the career with the highest prior expected utility
-            chosen_career = np.argmax(prior_expected_utility)
-            
-            # Store chosen career, prior expectation, and realized utility
-            chosen_careers[i, k] = chosen_career
-            prior_expectations[i, k] = prior_expected_utility[chosen_career]
-            realized_utilities[i, k] = par.v[chosen_career] + epsilon_self[chosen_career]
-    
-    # Calculate average share of graduates choosing each career
-    career_shares = np.zeros((par.N, par.J))
-    for i in range(par.N):
-        for j in range(par.J):
-            career_shares[i, j] = np.mean(chosen_careers[i, :] == j)
+
+####Streaming statistics
+
+class RunningStats:
+    # Running mean and variance over the first axis of streamed batches (Welford/Chan updates)
     
-    # Calculate average subjective expected utility and average realized utility
-    avg_prior_expectations = np.mean(prior_expectations, axis=1)
-    avg_realized_utilities = np.mean(realized_utilities, axis=1)
+    def __init__(self, shape=()):
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)
     
-    # Visualize the results
-    for i in range(par.N):
-        plt.figure(figsize=(12, 4))
+    def update(self, x):
+        # Fold a batch of observations, stacked along axis 0, into the statistics
+        x = np.asarray(x, dtype=float)
+        batch = RunningStats()
+        batch.n = x.shape[0]
+        batch.mean = x.mean(axis=0)
+        batch.M2 = ((x - batch.mean)**2).sum(axis=0)
+        return self.merge(batch)
+    
+    def merge(self, other):
+        # Combine with statistics from another set of observations
+        n = self.n + other.n
+        if n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.M2 = self.M2 + other.M2 + delta**2 * self.n * other.n / n
+        self.n = n
+        return self
+    
+    @property
+    def var(self):
+        # Sample variance of the observations
+        return self.M2 / (self.n - 1) if self.n > 1 else np.full_like(self.M2, np.nan)
+    
+    @property
+    def se(self):
+        # Standard error of the mean
+        return np.sqrt(self.var / self.n)
+
+
+####Simulation engine
+
+# Function to set up the accumulators for a simulation of N graduates and J careers
+def _career_stats(par, switching):
+    stats = SimpleNamespace(choice=RunningStats((par.N, par.J)),
+                            prior=RunningStats(par.N),
+                            realized=RunningStats(par.N))
+    if switching:
+        stats.new_choice = RunningStats((par.N, par.J))
+        stats.new_prior = RunningStats(par.N)
+        stats.new_realized = RunningStats(par.N)
+        stats.switch = RunningStats(par.N)
+    return stats
+
+# Function to simulate K draws for all graduates in chunks and stream them into the accumulators
+def _simulate_block(par, K, rngs, chunk_size, stats):
+    F = np.asarray(par.F, dtype=int)
+    v = np.asarray(par.v, dtype=float)
+    careers = np.arange(par.J)
+    switching = hasattr(stats, 'switch')
+    
+    # a. friends are stacked along one axis, graduate i owns the segment starting at starts[i]
+    starts = np.concatenate(([0], np.cumsum(F)[:-1]))
+    rng_friends, rng_self, rng_switch = rngs
+    
+    for k0 in range(0, K, chunk_size):
+        k = min(chunk_size, K - k0)
         
-        # Share of graduates choosing each career
-        plt.subplot(1, 3, 1)
-        plt.bar(range(1, par.J + 1), career_shares[i, :])
-        plt.xlabel('Career Track')
-        plt.ylabel('Share of Graduates')
-        plt.title(f'Graduate {i+1} - Career Choices')
-        plt.xticks(range(1, par.J + 1), range(1, par.J + 1))  # Set x-tick labels to 1, 2, 3
+        # b. prior expected utility from the mean of each graduate's friends, shape (k, N, J)
+        epsilon_friends = rng_friends.normal(0, par.sigma, (k, F.sum(), par.J))
+        prior_expected_utility = v + np.add.reduceat(epsilon_friends, starts, axis=1) / F[:, None]
         
-        # Average subjective expected utility
-        plt.subplot(1, 3, 2)
-        plt.bar([i + 1], avg_prior_expectations[i])
-        plt.xlabel('Graduate')
-        plt.ylabel('Avg Subjective Expected Utility')
-        plt.title(f'Graduate {i+1} - Avg Subjective Expected Utility')
-        plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
+        # c. choose the career with the highest prior and realise its utility
+        chosen_careers = np.argmax(prior_expected_utility, axis=2)
+        realized_utilities = v[chosen_careers] + rng_self.normal(0, par.sigma, (k, par.N))
         
-        # Average realized utility
-        plt.subplot(1, 3, 3)
-        plt.bar([i + 1], avg_realized_utilities[i])
-        plt.xlabel('Graduate')
-        plt.ylabel('Avg Realized Utility')
-        plt.title(f'Graduate {i+1} - Avg Realized Utility')
-        plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
+        stats.choice.update(chosen_careers[..., None] == careers)
+        stats.prior.update(np.max(prior_expected_utility, axis=2))
+        stats.realized.update(realized_utilities)
+        if not switching:
+            continue
         
-        plt.tight_layout()
-        plt.show()
+        # d. after one year the chosen career is known and every other career costs c to switch to
+        updated_prior = prior_expected_utility - par.c
+        np.put_along_axis(updated_prior, chosen_careers[..., None], realized_utilities[..., None], axis=2)
+        new_chosen_careers = np.argmax(updated_prior, axis=2)
+        switched = new_chosen_careers != chosen_careers
+        
+        # e. a switcher realises a fresh draw in the new career net of the switching cost
+        epsilon_switch = rng_switch.normal(0, par.sigma, (k, par.N))
+        new_realized_utilities = np.where(switched, v[new_chosen_careers] + epsilon_switch - par.c, realized_utilities)
+        
+        stats.new_choice.update(new_chosen_careers[..., None] == careers)
+        stats.new_prior.update(np.max(updated_prior, axis=2))
+        stats.new_realized.update(new_realized_utilities)
+        stats.switch.update(switched)
+    
+    return stats
 
-####Question3        
+# Function to collect the averages from the accumulators
+def _summarize(stats):
+    sim = SimpleNamespace(K=stats.choice.n, stats=stats,
+                          career_shares=stats.choice.mean,
+                          avg_prior_expectations=stats.prior.mean,
+                          avg_realized_utilities=stats.realized.mean)
+    if hasattr(stats, 'switch'):
+        sim.new_career_shares = stats.new_choice.mean
+        sim.avg_new_prior_expectations = stats.new_prior.mean
+        sim.avg_new_realized_utilities = stats.new_realized.mean
+        sim.switch_shares = stats.switch.mean
+    return sim
 
-# Function to simulate the scenario and calculate required metrics
-def simulate_and_visualize2(par):
-    np.random.seed(2021)
-    
-    # Initialize arrays to store results
-    chosen_careers = np.zeros((par.N, par.K), dtype=int)
-    prior_expectations = np.zeros((par.N, par.K))
-    realized_utilities = np.zeros((par.N, par.K))
-    new_prior_expectations = np.zeros((par.N, par.K))
-    new_realized_utilities = np.zeros((par.N, par.K))
-    switched_careers = np.zeros((par.N, par.K), dtype=bool)
-    
-    for k in range(par.K):
-        for i in range(par.N):
-            F_i = par.F[i]
-            
-            # Draw noise terms for friends and self
-            epsilon_friends = np.random.normal(0, par.sigma, (F_i, par.J))
-            epsilon_self = np.random.normal(0, par.sigma, par.J)
-            
-            # Calculate prior expected utility for each career
-            prior_expected_utility = par.v + np.mean(epsilon_friends, axis=0)
-            
-            # Choose the career with the highest prior expected utility
-            chosen_career = np.argmax(prior_expected_utility)
-            
-            # Store chosen career, prior expectation, and realized utility
-            chosen_careers[i, k] = chosen_career
-            prior_expectations[i, k] = prior_expected_utility[chosen_career]
-            realized_utilities[i, k] = par.v[chosen_career] + epsilon_self[chosen_career]
-            
-            # After one year, update priors considering the switching cost
-            updated_prior = np.copy(prior_expected_utility)
-            updated_prior[chosen_career] = realized_utilities[i, k]
-            for j in range(par.J):
-                if j != chosen_career:
-                    updated_prior[j] -= par.c
-            
-            # Choose the new optimal career
-            new_chosen_career = np.argmax(updated_prior)
-            new_prior_expectations[i, k] = updated_prior[new_chosen_career]
-            new_realized_utilities[i, k] = (
-                realized_utilities[i, k] if new_chosen_career == chosen_career else par.v[new_chosen_career] + np.random.normal(0, par.sigma) - par.c
-            )
-            
-            # Check if the career was switched
-            switched_careers[i, k] = (new_chosen_career != chosen_career)
-    
-    # Calculate average share of graduates choosing each career
-    career_shares = np.zeros((par.N, par.J))
-    for i in range(par.N):
-        for j in range(par.J):
-            career_shares[i, j] = np.mean(chosen_careers[i, :] == j)
+# Function to simulate one chunk from its seeds for friend, own and switching noise
+def _simulate_chunk(par, K, seeds, switching):
+    rngs = [np.random.default_rng(s) for s in seeds]
+    return _simulate_block(par, K, rngs, K, _career_stats(par, switching))
+
+# Function to run the chunks of one or more parameter sets, in a process pool if n_workers > 1
+def _run_chunks(pars, K, seed, chunk_size, switching, n_workers):
+    # a. every parameter set uses the same chunks and seeds (common random numbers)
+    sizes = [min(chunk_size, K - k0) for k0 in range(0, K, chunk_size)]
+    seeds = [seed_seq.spawn(3) for seed_seq in np.random.SeedSequence(seed).spawn(len(sizes))]
+    tasks = [(p, b) for p in range(len(pars)) for b in range(len(sizes))]
     
-    # Calculate average subjective expected utility and average realized utility
-    avg_prior_expectations = np.mean(new_prior_expectations, axis=1)
-    avg_realized_utilities = np.mean(new_realized_utilities, axis=1)
+    # b. simulate the chunks
+    partial = {}
+    if n_workers == 1:
+        for p, b in tasks:
+            partial[p, b] = _simulate_chunk(pars[p], sizes[b], seeds[b], switching)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(_simulate_chunk, pars[p], sizes[b], seeds[b], switching): (p, b) for p, b in tasks}
+            for future in as_completed(futures):
+                partial[futures[future]] = future.result()
+    
+    # c. merge in chunk order, so the results are bit-identical for any n_workers
+    sims = []
+    for p in range(len(pars)):
+        stats = _career_stats(pars[p], switching)
+        for b in range(len(sizes)):
+            for name, acc in vars(stats).items():
+                acc.merge(getattr(partial[p, b], name))
+        sims.append(_summarize(stats))
+    return sims
+
+# Function to run the simulation for one parameter set
+def _simulate(par, K, seed, chunk_size, switching, n_workers):
+    K = par.K if K is None else K
+    return _run_chunks([par], K, seed, chunk_size, switching, n_workers)[0]
+
+# Function to simulate every combination of the given parameter values, e.g. sigma=[1, 2], c=[0.5, 1]
+def simulate_sweep(par, K=None, seed=2021, chunk_size=20000, switching=True, n_workers=None, **values):
+    K = par.K if K is None else K
+    
+    # a. one copy of par for each combination of values
+    names = list(values)
+    combinations = list(itertools.product(*values.values()))
+    pars = [SimpleNamespace(**{**vars(par), **dict(zip(names, combination))}) for combination in combinations]
+    
+    # b. all chunks of all combinations share one pool
+    sims = _run_chunks(pars, K, seed, chunk_size, switching, n_workers)
+    return SimpleNamespace(names=names, values=combinations, pars=pars, sims=sims)
+
+
+####Plotting
+
+# Function to plot the simulation results for each graduate
+def plot_simulation(sim, par):
+    import matplotlib.pyplot as plt
     
-    # Calculate the share of graduates who switched careers
-    switch_shares = np.mean(switched_careers, axis=1)
+    # a. with switching, the utilities shown are those after the switching decision
+    switching = hasattr(sim, 'switch_shares')
+    avg_prior_expectations = sim.avg_new_prior_expectations if switching else sim.avg_prior_expectations
+    avg_realized_utilities = sim.avg_new_realized_utilities if switching else sim.avg_realized_utilities
+    panels = [('Avg Subjective Expected Utility', avg_prior_expectations),
+              ('Avg Realized Utility', avg_realized_utilities)]
+    if switching:
+        panels.append(('Share Switching Careers', sim.switch_shares))
+    ncols = 1 + len(panels)
     
-    # Visualize the results
     for i in range(par.N):
-        plt.figure(figsize=(16, 4))
+        plt.figure(figsize=(4 * ncols, 4))
         
         # Share of graduates choosing each career
-        plt.subplot(1, 4, 1)
-        plt.bar(range(1, par.J + 1), career_shares[i, :])
+        plt.subplot(1, ncols, 1)
+        plt.bar(range(1, par.J + 1), sim.career_shares[i, :])
         plt.xlabel('Career Track')
         plt.ylabel('Share of Graduates')
         plt.title(f'Graduate {i+1} - Career Choices')
         plt.xticks(range(1, par.J + 1), range(1, par.J + 1))  # Set x-tick labels to 1, 2, 3
         
-        # Average subjective expected utility
-        plt.subplot(1, 4, 2)
-        plt.bar([i + 1], avg_prior_expectations[i])
-        plt.xlabel('Graduate')
-        plt.ylabel('Avg Subjective Expected Utility')
-        plt.title(f'Graduate {i+1} - Avg Subjective Expected Utility')
-        plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
-        
-        # Average realized utility
-        plt.subplot(1, 4, 3)
-        plt.bar([i + 1], avg_realized_utilities[i])
-        plt.xlabel('Graduate')
-        plt.ylabel('Avg Realized Utility')
-        plt.title(f'Graduate {i+1} - Avg Realized Utility')
-        plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
-        
-        # Share of graduates who switched careers
-        plt.subplot(1, 4, 4)
-        plt.bar([i + 1], switch_shares[i])
-        plt.xlabel('Graduate')
-        plt.ylabel('Share Switching Careers')
-        plt.title(f'Graduate {i+1} - Share Switching Careers')
-        plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
+        # Per-graduate averages
+        for col, (label, values) in enumerate(panels, start=2):
+            plt.subplot(1, ncols, col)
+            plt.bar([i + 1], values[i])
+            plt.xlabel('Graduate')
+            plt.ylabel(label)
+            plt.title(f'Graduate {i+1} - {label}')
+            plt.xticks([i + 1], [i + 1])  # Set x-tick label to the graduate number
         
         plt.tight_layout()
         plt.show()
+
+
+####Question 2
+
+# Function to simulate the career choices without plotting
+def simulate_careers(par, K=None, seed=2021, chunk_size=20000, n_workers=1):
+    return _simulate(par, K, seed, chunk_size, False, n_workers)
+
+# Function to simulate the scenario and calculate required metrics
+def simulate_and_visualize(par):
+    sim = simulate_careers(par)
+    plot_simulation(sim, par)
+
+####Question3        
+
+# Function to simulate the career choices and the switching decision without plotting
+def simulate_switching(par, K=None, seed=2021, chunk_size=20000, n_workers=1):
+    return _simulate(par, K, seed, chunk_size, True, n_workers)
+
+# Function to simulate the scenario and calculate required metrics
+def simulate_and_visualize2(par):
+    sim = simulate_switching(par)
+    plot_simulation(sim, par)
@@ -1,10 +1,39 @@
+from types import SimpleNamespace
+from functools import lru_cache
+
 import numpy as np
-import matplotlib.pyplot as plt
 
-rng = np.random.default_rng(2024)
+# matplotlib and scipy are imported where they are used, so importing the module does no work
+
+####Data
 
-X = rng.uniform(size=(50,2))
-y = rng.uniform(size=(2,))
+# Function to draw the support points X (n, 2) and the point y (2,) as in the exam
+def make_data(n=50, seed=2024, memmap=None, chunk_size=10**6):
+    # With memmap set to a file path, X is written in chunks to a .npy memory-mapped file,
+    # with the same values as in memory because the draws are taken in the same order
+    rng = np.random.default_rng(seed)
+    if memmap is None:
+        X = rng.uniform(size=(n,2))
+    else:
+        X = np.lib.format.open_memmap(memmap, mode='w+', dtype=float, shape=(n,2))
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            X[start:stop] = rng.uniform(size=(stop - start, 2))
+        X.flush()
+    y = rng.uniform(size=(2,))
+    return X, y
+
+# Function to build the exam data and the precomputed points once per (n, seed)
+@lru_cache(maxsize=None)
+def exam_setup(n=50, seed=2024):
+    X, y = make_data(n, seed)
+    return SimpleNamespace(X=X, y=y, A=find_A(X, y), B=find_B(X, y), C=find_C(X, y), D=find_D(X, y), F=f(X.T))
+
+# The exam data used to be computed on import, module attributes X, y, A, B, C, D and F now build it on first use
+def __getattr__(name):
+    if name in ('X', 'y', 'A', 'B', 'C', 'D', 'F'):
+        return getattr(exam_setup(), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 ####Question1
 
@@ -36,13 +65,77 @@ def find_D(X, y):
     distances = np.sqrt(np.sum((valid_points-y)**2, axis=1))
     return valid_points[np.argmin(distances)]
 
-# Finding points A, B, C, and D
-A = find_A(X, y)
-B = find_B(X, y)
-C = find_C(X, y)
-D = find_D(X, y)
+class QuadrantIndex:
+    # Nearest point of X in each quadrant around many query points, A: up-right, B: down-right, C: down-left, D: up-left.
+    # Built once over X: a KD-tree for the nearest points and running extremes of x2 along sorted x1,
+    # which tell in O(log n) whether a quadrant has any point at all.
+    
+    def __init__(self, X, k0=8):
+        from scipy.spatial import cKDTree
+        
+        self.X = np.asarray(X, dtype=float)
+        self.tree = cKDTree(self.X)
+        self.k0 = k0
+        
+        # a. points sorted by x1 with the extremes of x2 to the left (prefix) and right (suffix) of each position
+        order = np.argsort(self.X[:, 0], kind='stable')
+        self.x1_sorted = self.X[order, 0]
+        x2 = self.X[order, 1]
+        inf = np.array([np.inf])
+        self.prefix_min = np.concatenate((inf, np.minimum.accumulate(x2)))
+        self.prefix_max = np.concatenate((-inf, np.maximum.accumulate(x2)))
+        self.suffix_min = np.concatenate((np.minimum.accumulate(x2[::-1])[::-1], inf))
+        self.suffix_max = np.concatenate((np.maximum.accumulate(x2[::-1])[::-1], -inf))
+    
+    def nonempty(self, Y):
+        # (m, 4) mask of the quadrants A, B, C, D that contain at least one point of X
+        right = np.searchsorted(self.x1_sorted, Y[:, 0], side='right')
+        left = np.searchsorted(self.x1_sorted, Y[:, 0], side='left')
+        return np.column_stack((self.suffix_max[right] > Y[:, 1], self.suffix_min[right] < Y[:, 1],
+                                self.prefix_min[left] < Y[:, 1], self.prefix_max[left] > Y[:, 1]))
+    
+    def query_indices(self, Y):
+        # (m, 4) indices into X of A, B, C, D for each row of Y, -1 where the quadrant is empty
+        Y = np.atleast_2d(np.asarray(Y, dtype=float))
+        n = len(self.X)
+        idx = np.full((len(Y), 4), -1)
+        missing = self.nonempty(Y)
+        
+        # a. look among the k nearest points and double k for the queries that still miss a quadrant
+        k = min(self.k0, n)
+        todo = np.nonzero(missing.any(axis=1))[0]
+        while todo.size > 0:
+            _, neighbours = self.tree.query(Y[todo], k=k, workers=-1)
+            neighbours = neighbours.reshape(len(todo), k)
+            P = self.X[neighbours]
+            y = Y[todo, None, :]
+            right, up = P[..., 0] > y[..., 0], P[..., 1] > y[..., 1]
+            left, down = P[..., 0] < y[..., 0], P[..., 1] < y[..., 1]
+            in_quadrant = np.stack((right & up, right & down, left & down, left & up), axis=2)
+            
+            # b. neighbours are sorted by distance, so the first hit in a quadrant is the nearest
+            hit = in_quadrant.any(axis=1) & missing[todo]
+            first = np.argmax(in_quadrant, axis=1)
+            rows, quadrants = np.nonzero(hit)
+            idx[todo[rows], quadrants] = neighbours[rows, first[rows, quadrants]]
+            missing[todo] &= ~hit
+            
+            if k == n:
+                break
+            todo = todo[missing[todo].any(axis=1)]
+            k = min(2 * k, n)
+        
+        return idx
+    
+    def query(self, Y):
+        # A, B, C, D as (m, 2) arrays with NaN rows where the quadrant is empty
+        idx = self.query_indices(Y)
+        points = np.where(idx[..., None] >= 0, self.X[idx], np.nan)
+        return points[:, 0], points[:, 1], points[:, 2], points[:, 3]
 
 def plot_points_and_triangles(X, y, A, B, C, D):
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(8, 8))
     plt.scatter(X[:, 0], X[:, 1], color='blue', label='Points in X')
     plt.scatter(y[0], y[1], color='red', label='Point y')
@@ -80,6 +173,35 @@ def barycentric_coordinates(A, B, C, y):
     r3 = 1 - r1 - r2
     return r1, r2, r3
 
+def barycentric_batch(A, B, C, Y):
+    # Barycentric coordinates of every row of Y in the triangles with corners in the rows of A, B, C, shape (m, 3)
+    A, B, C, Y = (np.asarray(P, dtype=float) for P in (A, B, C, Y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = (B[:, 1] - C[:, 1]) * (A[:, 0] - C[:, 0]) + (C[:, 0] - B[:, 0]) * (A[:, 1] - C[:, 1])
+        r1 = ((B[:, 1] - C[:, 1]) * (Y[:, 0] - C[:, 0]) + (C[:, 0] - B[:, 0]) * (Y[:, 1] - C[:, 1])) / denom
+        r2 = ((C[:, 1] - A[:, 1]) * (Y[:, 0] - C[:, 0]) + (A[:, 0] - C[:, 0]) * (Y[:, 1] - C[:, 1])) / denom
+    return np.column_stack((r1, r2, 1 - r1 - r2))
+
+def inside(r):
+    # Rows of barycentric coordinates that lie in the triangle, False for missing corners (NaN)
+    return np.all((r >= 0) & (r <= 1), axis=1)
+
+def quadrant_weights(Y, A, B, C, D, indices=None):
+    # Weights of the A/B/C/D rule for many query points: corners (m, 3, 2), weights (m, 3) and a validity mask.
+    # Triangle ABC is used where it contains y, otherwise CDA, otherwise the row is invalid.
+    # With indices, the (m, 4) positions of A, B, C, D in X, the (m, 3) positions of the corners are returned too.
+    r_ABC = barycentric_batch(A, B, C, Y)
+    r_CDA = barycentric_batch(C, D, A, Y)
+    in_ABC = inside(r_ABC)
+    in_CDA = inside(r_CDA) & ~in_ABC
+    
+    corners = np.where(in_ABC[:, None, None], np.stack((A, B, C), axis=1), np.stack((C, D, A), axis=1))
+    weights = np.where(in_ABC[:, None], r_ABC, r_CDA)
+    if indices is None:
+        return corners, weights, in_ABC | in_CDA
+    corner_indices = np.where(in_ABC[:, None], indices[:, [0, 1, 2]], indices[:, [2, 3, 0]])
+    return corners, weights, in_ABC | in_CDA, corner_indices
+
 
 def calculate_barycentric_coordinates(A, B, C, D, y):
     results = {}
@@ -100,7 +222,10 @@ def calculate_barycentric_coordinates(A, B, C, D, y):
 ####Question3
 
 f = lambda x: x[0]*x[1]
-F = np.array([f(x) for x in X])
+
+# Function to evaluate f in all points of X at once, f works on stacked coordinates
+def function_values(X, f=f):
+    return f(np.asarray(X).T)
 
 def approximation(A, B, C, D, r_ABC_1, r_ABC_2, r_ABC_3, r_CDA_1, r_CDA_2, r_CDA_3):
     """**Algorithm:**"""
@@ -117,6 +242,13 @@ def approximation(A, B, C, D, r_ABC_1, r_ABC_2, r_ABC_3, r_CDA_1, r_CDA_2, r_CDA
     else:
         return np.nan
 
+def approximate_batch(Y, A, B, C, D, f=f):
+    # Approximation of f in every row of Y from its precomputed A, B, C, D, NaN where neither triangle contains y.
+    # f is evaluated on the coordinates stacked first, f(x) with x of shape (2, ...), as f above.
+    corners, weights, valid = quadrant_weights(Y, A, B, C, D)
+    values = np.sum(weights * f(np.moveaxis(corners, -1, 0)), axis=1)
+    return np.where(valid, values, np.nan)
+
 def run_approximation(A, B, C, D, r_ABC_1, r_ABC_2, r_ABC_3, r_CDA_1, r_CDA_2, r_CDA_3, y):
     approximation_y = approximation(A, B, C, D, r_ABC_1, r_ABC_2, r_ABC_3, r_CDA_1, r_CDA_2, r_CDA_3)
     true_y = f(y)
@@ -132,38 +264,93 @@ Y = [(0.2,0.2),(0.8,0.2),(0.8,0.8),(0.8,0.2),(0.5,0.5)]
 
 def q3_y1(X, Y):
     results = []
+    A_Y, B_Y, C_Y, D_Y = QuadrantIndex(X).query(Y)
+    approximations = approximate_batch(Y, A_Y, B_Y, C_Y, D_Y)
 
     for i in range(len(Y)):
-        A_1 = find_A(X, Y[i])
-        B_1 = find_B(X, Y[i])
-        C_1 = find_C(X, Y[i])
-        D_1 = find_D(X, Y[i])
-
-        if not np.isnan(A_1[0]) and not np.isnan(B_1[0]) and not np.isnan(C_1[0]):
-            r_ABC_1, r_ABC_2, r_ABC_3 = barycentric_coordinates(A_1, B_1, C_1, Y[i])
-
-        if not np.isnan(C_1[0]) and not np.isnan(D_1[0]) and not np.isnan(A_1[0]):
-            r_CDA_1, r_CDA_2, r_CDA_3 = barycentric_coordinates(C_1, D_1, A_1, Y[i])
-
-        if not np.isnan(A_1[0]) and not np.isnan(B_1[0]) and not np.isnan(C_1[0]) and r_ABC_1 >= 0 and r_ABC_1 <= 1 and r_ABC_2 >= 0 and r_ABC_2 <= 1 and r_ABC_3 >= 0 and r_ABC_3 <= 1:
-            approximation_y_1 = r_ABC_1 * f(A_1) + r_ABC_2 * f(B_1) + r_ABC_3 * f(C_1)
-            true_y_1 = f(Y[i])
-            print(f'Approximation of f(Y[{i}]): {approximation_y_1}')
+        true_y_1 = f(Y[i])
+        if np.isnan(approximations[i]):
+            print(f'No valid triangle found for Y[{i}].')
             print(f'True value of f(Y[{i}]): {true_y_1}')
-            results.append(approximation_y_1)
             continue
+        
+        print(f'Approximation of f(Y[{i}]): {approximations[i]}')
+        print(f'True value of f(Y[{i}]): {true_y_1}')
+        results.append(approximations[i])
 
-        elif not np.isnan(C_1[0]) and not np.isnan(D_1[0]) and not np.isnan(A_1[0]) and r_CDA_1 >= 0 and r_CDA_2 >= 0 and r_CDA_3 >= 0 and r_CDA_1 <= 1 and r_CDA_2 <= 1 and r_CDA_3 <= 1:
-            approximation_y_1 = r_CDA_1 * f(C_1) + r_CDA_2 * f(D_1) + r_CDA_3 * f(A_1)
-            true_y_1 = f(Y[i])
-            print(f'Approximation of f(Y[{i}]): {approximation_y_1}')
-            print(f'True value of f(Y[{i}]): {true_y_1}')
-            results.append(approximation_y_1)
-            continue
+    return results if results else np.nan
 
-        else:
-            true_y_1 = f(Y[i])
-            print(f'No valid triangle found for Y[{i}].')
-            print(f'True value of f(Y[{i}]): {true_y_1}')
 
-    return results if results else np.nan
\ No newline at end of file
+####Interpolator
+
+class Interpolator:
+    # Piecewise-linear interpolation of functions on the points X, with the search structures built once.
+    # mode='delaunay' triangulates X and caches the inverse barycentric transforms of the simplices;
+    # query points are located by the triangulation's point location and are NaN outside the convex hull.
+    # mode='quadrant' uses the A/B/C/D rule of the questions above.
+    
+    def __init__(self, X, mode='delaunay'):
+        from scipy.spatial import Delaunay
+        
+        self.X = np.asarray(X, dtype=float)
+        self.mode = mode
+        if mode == 'delaunay':
+            self.tri = Delaunay(self.X)
+            self.transform = self.tri.transform
+        elif mode == 'quadrant':
+            self.index = QuadrantIndex(self.X)
+        else:
+            raise ValueError(f'unknown mode {mode!r}')
+    
+    def _bucket_order(self, Y):
+        # Order of the rows of Y column by column of a grid over the points, alternating up and down
+        n_buckets = max(int(np.sqrt(len(self.X))), 1)
+        lo, hi = self.X.min(axis=0), self.X.max(axis=0)
+        cell = np.clip(((Y - lo) / np.where(hi > lo, hi - lo, 1) * n_buckets).astype(int), 0, n_buckets - 1)
+        row = np.where(cell[:, 0] % 2 == 0, cell[:, 1], n_buckets - 1 - cell[:, 1])
+        return np.argsort(cell[:, 0] * n_buckets + row, kind='stable')
+    
+    def weights(self, Y):
+        # Indices into X (m, 3), weights (m, 3) and validity mask (m,) for the rows of Y
+        Y = np.atleast_2d(np.asarray(Y, dtype=float))
+        
+        if self.mode == 'delaunay':
+            # a. locate the points in buckets visited in a serpentine order, so each walk starts next to its point
+            simplex = np.empty(len(Y), dtype=int)
+            order = self._bucket_order(Y)
+            simplex[order] = self.tri.find_simplex(Y[order])
+            
+            # b. barycentric coordinates from the cached affine transforms
+            valid = simplex >= 0
+            T = self.transform[np.where(valid, simplex, 0)]
+            b = np.einsum('mij,mj->mi', T[:, :2], Y - T[:, 2])
+            weights = np.column_stack((b, 1 - b.sum(axis=1)))
+            indices = self.tri.simplices[np.where(valid, simplex, 0)]
+        else:
+            # c. the A/B/C/D rule on the corner indices
+            idx = self.index.query_indices(Y)
+            A, B, C, D = np.moveaxis(np.where(idx[..., None] >= 0, self.X[idx], np.nan), 1, 0)
+            _, weights, valid, indices = quadrant_weights(Y, A, B, C, D, indices=idx)
+        
+        weights = np.where(valid[:, None], weights, 0.0)
+        indices = np.where(valid[:, None], indices, 0)
+        return indices, weights, valid
+    
+    def plan(self, Y):
+        # Sparse (m, n) matrix of interpolation weights for the rows of Y, reusable for any values on X
+        from scipy import sparse
+        
+        indices, weights, valid = self.weights(Y)
+        m = len(indices)
+        W = sparse.csr_matrix((weights.ravel(), indices.ravel(), np.arange(0, 3 * m + 1, 3)), shape=(m, len(self.X)))
+        return SimpleNamespace(W=W, valid=valid)
+    
+    def apply(self, plan, F):
+        # Interpolated values of F, given on X as shape (n,) or (n, n_functions), with one sparse matrix product
+        values = plan.W @ np.asarray(F, dtype=float)
+        values[~plan.valid] = np.nan
+        return values
+    
+    def __call__(self, Y, F):
+        # Interpolated values of F in the rows of Y
+        return self.apply(self.plan(Y), F)
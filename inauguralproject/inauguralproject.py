@@ -1,13 +1,123 @@
 from types import SimpleNamespace
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import os
+import pickle
 import numpy as np
 from scipy import optimize
 
 
+class ParameterSet(SimpleNamespace):
+    """model parameters, each a scalar or a broadcastable numpy array
+
+    replace() and grid() return modified copies and never change the original,
+    so one set of parameters can be shared safely between model instances.
+
+    Each project folder is imported on its own from its notebook, so the same
+    class is also defined in examproject/problem1.py and
+    modelproject/modelproject.py; keep the three copies identical."""
+
+    def replace(self,**kwargs):
+        """copy with the given entries replaced"""
+        new = ParameterSet(**vars(self))
+        for key, value in kwargs.items():
+            setattr(new,key,value)
+        return new
+
+    def grid(self,**kwargs):
+        """copy where each given array gets its own axis, e.g. grid(tau=taus,T=Ts) has shape (len(taus),len(Ts))"""
+        new = ParameterSet(**vars(self))
+        n = len(kwargs)
+        for i, (key, value) in enumerate(kwargs.items()):
+            shape = [1]*n
+            shape[i] = -1
+            setattr(new,key,np.asarray(value,dtype=float).reshape(shape))
+        return new
+
+    @property
+    def shape(self):
+        """broadcast shape of all array entries"""
+        return np.broadcast_shapes(*(value.shape for value in vars(self).values() if isinstance(value,np.ndarray)))
+
+
+class SolutionCache:
+    """LRU cache of solved models keyed on a hash of parameters and solver options
+
+    If path is given, entries are also pickled to that directory so they
+    survive restarts. hits, disk_hits and misses count lookups.
+
+    Each project folder is imported on its own from its notebook, so the same
+    class is also defined in examproject/problem1.py; keep the two copies identical."""
+
+    def __init__(self, maxsize=128, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, name, par, names, **options):
+        """hash of the method name, the parameters in names and the solver options"""
+        h = hashlib.sha256(name.encode())
+        for key, value in [(n, getattr(par, n)) for n in names] + sorted(options.items()):
+            value = np.asarray(value)
+            h.update(f'{key}:{value.dtype}:{value.shape}:'.encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        return h.hexdigest()
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) on a miss"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+
+        if self.path is not None:
+            filename = os.path.join(self.path, f'{key}.pkl')
+            if os.path.exists(filename):
+                with open(filename, 'rb') as f:
+                    value = pickle.load(f)
+                self._store(key, value)
+                self.disk_hits += 1
+                return True, value
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.path is not None:
+            filename = os.path.join(self.path, f'{key}.pkl')
+            with open(filename + '.tmp', 'wb') as f:
+                pickle.dump(value, f)
+            os.replace(filename + '.tmp', filename)
+
+    def _store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """empty the memory tier and reset the counters, files on disk are kept"""
+        self.entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+
 class ExchangeEconomyClass:
 
+    # solved equilibria shared by all instances, replace to resize or add a disk tier
+    cache = SolutionCache()
+
     def __init__(self):
 
-        par = self.par = SimpleNamespace()
+        par = self.par = ParameterSet()
 
         # a. preferences
         par.alpha = 1/3
@@ -22,6 +132,18 @@ class ExchangeEconomyClass:
         par.maxiter = 500 # iter
         par.kappa = 1 # 0.1
 
+    def with_par(self,**kwargs):
+        """new economy with some parameters replaced, this economy is left unchanged"""
+        model = type(self)()
+        model.par = self.par.replace(**kwargs)
+        return model
+
+    def _require_scalar(self,name):
+        """numerical solvers and grid searches handle one economy at a time"""
+        if self.par.shape != ():
+            raise ValueError(f'{name} needs scalar parameters, got a parameter grid of shape {self.par.shape}; '
+                             'use the closed-form solve_* methods or loop over with_par variants')
+
     def utility_A(self,x1A,x2A):
         par = self.par
         return x1A**par.alpha*x2A**(1-par.alpha)
@@ -94,10 +216,53 @@ class ExchangeEconomyClass:
 
         return excess_demand
     
+    def price_sweep(self,p1,par_sets=None):
+        """demand and excess demand for many prices in one pass
+
+        p1 is an array of prices. par_sets is an optional (M,4) array of
+        (alpha, beta, w1A, w2A) rows; if given, results have shape (M,len(p1)),
+        otherwise the parameters in par are used and results have the shape of p1."""
+        par = self.par
+        p1 = np.asarray(p1,dtype=float)
+
+        # a. parameters
+        if par_sets is None:
+            alpha, beta, w1A, w2A = par.alpha, par.beta, par.w1A, par.w2A
+        else:
+            par_sets = np.atleast_2d(np.asarray(par_sets,dtype=float))
+            alpha, beta, w1A, w2A = (par_sets[:,k,np.newaxis] for k in range(4))
+
+        # b. demand
+        x1A = alpha * ((p1*w1A + w2A) / p1)
+        x2A = (1-alpha) * ((p1*w1A + w2A))
+        x1B = beta * ((p1*(1-w1A) + (1-w2A)) / p1)
+        x2B = (1-beta) * ((p1*(1-w1A)+(1-w2A)))
+
+        # c. excess demand
+        eps1 = x1A-w1A + x1B-(1-w1A)
+        eps2 = x2A-w2A + x2B-(1-w2A)
+
+        return SimpleNamespace(p1=p1,x1A=x1A,x2A=x2A,x1B=x1B,x2B=x2B,eps1=eps1,eps2=eps2)
+
     #3.
-    def find_equilibrium(self,p1_guess):
+    def find_equilibrium(self,p1_guess,do_print=True):
+        """tatonnement for the equilibrium price, the result is returned and kept in self.sol"""
         
         par = self.par
+        self._require_scalar('find_equilibrium')
+
+        # a. serve from cache if this economy was solved before
+        key = self.cache.key(f'{type(self).__qualname__}.find_equilibrium',par,('alpha','beta','w1A','w2A','eps','maxiter','kappa'),p1_guess=p1_guess)
+        found, value = self.cache.get(key)
+        if found and value is None:
+            if do_print: print('solution was not found')
+            self.sol = SimpleNamespace(p1=np.nan,z1=np.nan,z2=np.nan,converged=False)
+            return self.sol
+        if found:
+            p1, z1, z2 = value
+            if do_print: print(f'cached: p1={p1:12.8f} -> exess demand -> {z1:14.8f}')
+            self.sol = SimpleNamespace(p1=p1,z1=z1,z2=z2,converged=True)
+            return self.sol
         
         t=0
         p1 = p1_guess
@@ -111,14 +276,14 @@ class ExchangeEconomyClass:
 
             # 2. stop coomand
             if np.abs(z1) < par.eps or t>=par.maxiter:
-                print(f'{t:3d}: p1={p1:12.8f} -> exess demand -> {z1:14.8f}')
+                if do_print: print(f'{t:3d}: p1={p1:12.8f} -> exess demand -> {z1:14.8f}')
                 break
             
             # 3. 
-            if t<5 or t%25==0:
+            if do_print and (t<5 or t%25==0):
                 print(f'{t:3d}: p1={p1:12.8f} -> exess demand -> {z1:14.8f}')
 
-            elif t==5:
+            elif do_print and t==5:
                 print('     ...')
 
             # 4. 
@@ -131,72 +296,66 @@ class ExchangeEconomyClass:
         if np.abs(z1) < par.eps:
             
             # store eguilibrium
-            par.p1_star = p1 
+            z2 = self.excess_demand_x2(p1)
 
-            par.z1 = z1
-            par.z2 = self.excess_demand_x2(par.p1_star)
-
-            if not np.abs(par.z2) < par.eps: 
+            if not np.abs(z2) < par.eps and do_print: 
                 print('the market for good 2 was not cleared')
-                print(f'z2={par.z2}')
+                print(f'z2={z2}')
+            
+            self.cache.put(key,(p1,z1,z2))
+            self.sol = SimpleNamespace(p1=p1,z1=z1,z2=z2,converged=True)
             
         else:
-            print('solution was not found')
+            self.cache.put(key,None)
+            if do_print: print('solution was not found')
+            self.sol = SimpleNamespace(p1=np.nan,z1=np.nan,z2=np.nan,converged=False)
 
-        
+        return self.sol
     
     def print_solution(self):
 
-        par = self.par
+        sol = self.sol
+
+        if not sol.converged:
+            print('solution was not found')
+            return
 
         text = 'solution to market equilibrium:\n'
-        text += f'p1 = {par.p1_star:5.3f}\n'
+        text += f'p1 = {sol.p1:5.3f}\n'
         text += 'p2 = 1\n'
 
         text += 'excess demand are:\n'
-        text += f'z1 = {par.z1}\n'
-        text += f'z2= {par.z2}'
+        text += f'z1 = {sol.z1}\n'
+        text += f'z2= {sol.z2}'
         print(text)
     
 
     #4.a
     def find_best_choice_test(self,N,do_print=True): # ,do_print=True
         
-        par = self.par
-        # a. allocate numpy arrays
-        shape_tuple = (N)
-        #p1 = np.empty(shape_tuple)
-        x1_values = np.empty(shape_tuple)
-        x2_values = np.empty(shape_tuple)
-        u_values = np.empty(shape_tuple)
+        # a. prices and the allocation left to A by B's demand
+        p1_values = 0.5 + 2*(np.arange(N) / N)
+        sweep = self.price_sweep(p1_values)
+        x1_values = 1 - sweep.x1B
+        x2_values = 1 - sweep.x2B
+
+        # b. utility where the allocation is feasible
+        feasible = (x1_values >= 0) & (x2_values >= 0)
+        with np.errstate(invalid='ignore'):
+            u_values = np.where(feasible, self.utility_A(x1_values,x2_values), -np.inf)
     
-        # b. start from guess of x1=x2=0
+        # c. start from guess of x1=x2=0
         x1_best = 0.01
         x2_best = 0.01
         u_best = self.utility_A(0.1,0.1)
-    
-        # c. loop through all possibilities
-        for i in range(N):
-        
-            # p1[i] = (0.5 + 2*(i / N))
-            # i. x1
-            x1_values[i] = x1 = 1 - (par.beta * (((0.5 + 2*(i / N))*(1-par.w1A) + (1-par.w2A)) / (0.5 + 2*(i / N))))
-        
-            # ii. implied x2 by budget constraint
-            x2_values[i] = x2 = 1 - (1-par.beta) * (((0.5 + 2*(i / N))*(1-par.w1A)+(1-par.w2A)))
-            
-            if x1_values[i] < 0 or x2_values[i] < 0:
-                continue 
 
-            # iii. utility    
-            u_values[i] = self.utility_A(x1_values[i],x2_values[i])
-        
-            if u_values[i] >= u_best:    
-                x1_best = x1_values[i]
-                x2_best = x2_values[i] 
-                u_best = u_values[i]
-                p1 = (0.5 + 2*(i / N))
-              
+        # d. last price attaining the maximum (ties go to the later price as in a >= loop)
+        i = N - 1 - np.argmax(u_values[::-1])
+        if u_values[i] >= u_best:
+            x1_best = x1_values[i]
+            x2_best = x2_values[i]
+            u_best = u_values[i]
+            p1 = float(p1_values[i])
 
         return x1_best,x2_best,u_best,p1 #,x1_values,x2_values,u_values
 
@@ -226,36 +385,30 @@ class ExchangeEconomyClass:
 
     #4.b loop
     def find_best_choice_test_B_1(self): 
-        par = self.par
         p1_val = np.linspace(0.001, 10.000, 100000)
         
-        # Initialize variables to store the optimal utility and price
-        u_A_opt = 0 
-        p1_opt = 0
-        
-        # Loop through all possibilities of p1
-        for p1 in p1_val:
-            # Calculate demand for good B given p1
-            x1B, x2B = self.demand_B(p1)
+        # a. demand of B for all prices at once
+        sweep = self.price_sweep(p1_val)
             
-            # Calculate x1 and x2 for agent A
-            x1 = 1 - x1B
-            x2 = 1 - x2B
-            
-            # Calculate utility for agent A given x1 and x2
+        # b. allocation left to A and A's utility
+        x1 = 1 - sweep.x1B
+        x2 = 1 - sweep.x2B
+        with np.errstate(invalid='ignore'):
             u_A = self.utility_A(x1, x2)
             
-            # Update optimal utility and price if current utility is higher
-            if u_A > u_A_opt:
-                u_A_opt = u_A
-                p1_opt = p1
+        # c. first price with the highest utility (NaN for infeasible allocations never wins)
+        u_A = np.where(np.isnan(u_A), -np.inf, u_A)
+        i = np.argmax(u_A)
+        u_A_opt = u_A[i] if u_A[i] > 0 else 0
+        p1_opt = p1_val[i] if u_A[i] > 0 else 0
 
-        return x1, x2, u_A_opt, p1_opt
+        return x1[-1], x2[-1], u_A_opt, p1_opt
     
 
     # 4.b using solver 
     def find_best_choice_any_price(self):
         par = self.par
+        self._require_scalar('find_best_choice_any_price')
         
         # Objective function to minimize (negative utility)
         def objective(p1):
@@ -279,74 +432,70 @@ class ExchangeEconomyClass:
             raise RuntimeError("Optimization failed to find a solution")
 
     
-    def opgave_5_A(self): 
+    def grid_search(self, N, objective='A', block_size=500):
+        """vectorized grid search over the edgeworth box
+
+        objective='A' maximizes u_A subject to u_B >= u_B(endowment),
+        objective='social' maximizes u_A + u_B. The grid is evaluated in blocks
+        of block_size rows of x1A so memory stays at block_size*N. Ties are
+        resolved as in the scalar loops (first point in x1A-major order). It
+        solves one economy, a parameter grid raises ValueError."""
         par = self.par
-        x1A_val = np.linspace(0.0, 1.0, 76)
-        x2A_val = np.linspace(0.0, 1.0, 76)
+        self._require_scalar('grid_search')
+        x1A_val = np.linspace(0.0, 1.0, N)
+        x2A_val = np.linspace(0.0, 1.0, N)
 
-        # Initialize variables to store the optimal utility and price
-        u_A_opt = 0 
+        # a. initial values (same starting points as the scalar loops)
+        u_B_initial = self.utility_B(1-par.w1A,1-par.w2A)
+        if objective == 'A':
+            best = 0
+        elif objective == 'social':
+            best = self.utility_A(par.w1A,par.w2A) + u_B_initial
+        else:
+            raise ValueError(f'unknown objective: {objective}')
+
+        u_A_opt = 0
         x1A_opt = 0
         x2A_opt = 0
-        u_B_initial = self.utility_B(1-par.w1A,1-par.w2A)
-        
-        # Loop through all possibilities of p1
-        for x1A in x1A_val:
-            for x2A in x2A_val:
-                # Calculate demand for good B given p1
-            
-                # Calculate x1 and x2 for agent A
-                x1B = 1 - x1A
-                x2B = 1 - x2A
-            
-                # Calculate utility for agent A given x1 and x2
-                u_A = self.utility_A(x1A,x2A)
-                u_B = self.utility_B(x1B,x2B)
-            
-                # Update optimal utility and price if current utility is higher
-                if u_A > u_A_opt and u_B >= u_B_initial:
-                    u_A_opt = u_A
-                    x1A_opt = x1A
-                    x2A_opt = x2A
 
-        return u_A_opt, x1A_opt, x2A_opt
-    
+        # b. loop over blocks of rows
+        x2A = x2A_val[np.newaxis,:]
+        x2B = 1 - x2A
+        for start in range(0, N, block_size):
+            x1A = x1A_val[start:start+block_size,np.newaxis]
+            x1B = 1 - x1A
 
-    def opgave_5_B(self): 
-        par = self.par
-        x1A_val = np.linspace(0.0, 1.0, 5000)
-        x2A_val = np.linspace(0.0, 1.0, 5000)
+            # i. utilities on the block
+            u_A = self.utility_A(x1A,x2A)
+            u_B = self.utility_B(x1B,x2B)
 
-        # Initialize variables to store the optimal utility and price
-        u_A_opt = 0 
-        x1A_opt = 0
-        x2A_opt = 0
-        u_B_initial = self.utility_B(1-par.w1A,1-par.w2A)
-        
-        # Loop through all possibilities of p1
-        for x1A in x1A_val:
-            for x2A in x2A_val:
-                # Calculate demand for good B given p1
-            
-                # Calculate x1 and x2 for agent A
-                x1B = 1 - x1A
-                x2B = 1 - x2A
-            
-                # Calculate utility for agent A given x1 and x2
-                u_A = self.utility_A(x1A,x2A)
-                u_B = self.utility_B(x1B,x2B)
-            
-                # Update optimal utility and price if current utility is higher
-                if u_A > u_A_opt and u_B >= u_B_initial:
-                    u_A_opt = u_A
-                    x1A_opt = x1A
-                    x2A_opt = x2A
+            # ii. objective with infeasible points masked out
+            if objective == 'A':
+                value = np.where(u_B >= u_B_initial, u_A, -np.inf)
+            else:
+                value = u_A + u_B
+
+            # iii. keep the block optimum if it strictly improves
+            i, j = np.unravel_index(np.argmax(value), value.shape)
+            if value[i,j] > best:
+                best = value[i,j]
+                u_A_opt = u_A[i,j]
+                x1A_opt = x1A_val[start+i]
+                x2A_opt = x2A_val[j]
 
         return u_A_opt, x1A_opt, x2A_opt
+
+    def opgave_5_A(self): 
+        return self.grid_search(76, objective='A')
+    
+
+    def opgave_5_B(self): 
+        return self.grid_search(5000, objective='A')
     
     # 5.b
     def opgave_5_B_solver(self):
         par = self.par
+        self._require_scalar('opgave_5_B_solver')
 
         # Initial utility for B at the initial endowment
         u_B_initial = self.utility_B(1 - par.w1A, 1 - par.w2A)
@@ -383,37 +532,7 @@ class ExchangeEconomyClass:
             raise RuntimeError("Optimization failed to find a solution")
 
     def opgave_6_A(self): 
-        par = self.par
-        x1A_val = np.linspace(0.0, 1.0, 5000)
-        x2A_val = np.linspace(0.0, 1.0, 5000)
-
-        # Initialize variables to store the optimal utility and price
-        u_A_initial = self.utility_A(par.w1A,par.w2A) 
-        x1A_opt = 0
-        x2A_opt = 0
-        u_B_initial = self.utility_B(1-par.w1A,1-par.w2A)
-        u_initial = u_A_initial + u_B_initial
-        
-        # Loop through all possibilities of p1
-        for x1A in x1A_val:
-            for x2A in x2A_val:
-                # Calculate demand for good B given p1
-            
-                # Calculate x1 and x2 for agent A
-                x1B = 1 - x1A
-                x2B = 1 - x2A
-            
-                # Calculate utility for agent A given x1 and x2
-                u_A = self.utility_A(x1A,x2A)
-                u_B = self.utility_B(x1B,x2B)
-                social_u = u_A + u_B
-            
-                # Update optimal utility and price if current utility is higher
-                if  social_u > u_initial:
-                    x1A_opt = x1A
-                    x2A_opt = x2A
-                    u_initial = social_u
-
+        u_A_opt, x1A_opt, x2A_opt = self.grid_search(5000, objective='social')
         return x1A_opt, x2A_opt
     
     def check_market_clearing2(self, p1):
@@ -445,15 +564,318 @@ class ExchangeEconomyClass:
         return excess_demand
 
     def find_best_price(self, price_range):
-        best_price = None
-        min_excess_demand = float('inf')
+        # a. excess demand for all prices at once
+        sweep = self.price_sweep(price_range)
+        excess_demand = np.abs(sweep.eps1) + np.abs(sweep.eps2)  # Total excess demand
+        excess_demand = np.where(np.isnan(excess_demand), np.inf, excess_demand)
+
+        if not np.any(excess_demand < float('inf')):
+            return None, float('inf')
+
+        # b. first price with the smallest total excess demand
+        i = np.argmin(excess_demand)
+        return price_range[i], excess_demand[i]
+
+
+    # analytic fast paths with numerical fallback
+    def has_closed_form(self):
+        """True if both consumers have the built-in Cobb-Douglas preferences with interior shares"""
+        par = self.par
+        cobb_douglas = (type(self).utility_A is ExchangeEconomyClass.utility_A
+                        and type(self).utility_B is ExchangeEconomyClass.utility_B
+                        and type(self).demand_A is ExchangeEconomyClass.demand_A
+                        and type(self).demand_B is ExchangeEconomyClass.demand_B)
+        interior = (np.all((0 < par.alpha) & (par.alpha < 1)) and np.all((0 < par.beta) & (par.beta < 1))
+                    and np.all((0 <= par.w1A) & (par.w1A <= 1)) and np.all((0 <= par.w2A) & (par.w2A <= 1)))
+        return cobb_douglas and bool(interior)
+
+    def _no_closed_form(self,method,reason):
+        """raise for method='analytic', otherwise tell the caller to use the numerical path"""
+        if method == 'analytic':
+            raise ValueError(f'no closed form applies to this economy: {reason}')
+        return False
+
+    def _check_method(self,method):
+        if method not in ('auto','analytic','numeric'):
+            raise ValueError(f'unknown method: {method}')
+        use_analytic = method != 'numeric' and self.has_closed_form()
+        if method == 'analytic' and not use_analytic:
+            raise ValueError('no closed form applies to this economy')
+        return use_analytic
+
+    def solve_equilibrium(self,p1_guess=1.0,method='auto'):
+        """walrasian equilibrium price, closed form for Cobb-Douglas else tatonnement
+
+        The returned namespace reports the path taken ('analytic' or 'numeric')
+        and whether it converged; p1, z1 and z2 are NaN if it did not. The
+        closed form broadcasts over a parameter grid, the numerical path does not."""
+        par = self.par
+        use_analytic = self._check_method(method)
+
+        # a. closed form: z1(p1) = 0 is linear in p1
+        if use_analytic:
+            denom = 1 - par.alpha*par.w1A - par.beta*(1-par.w1A)
+            if not np.all(denom > 0):
+                use_analytic = self._no_closed_form(method,'1 - alpha*w1A - beta*(1-w1A) must be positive')
+        if use_analytic:
+            p1 = (par.alpha*par.w2A + par.beta*(1-par.w2A)) / denom
+            z1 = self.excess_demand_x1(p1)
+            z2 = self.excess_demand_x2(p1)
+            return SimpleNamespace(p1=p1,z1=z1,z2=z2,converged=np.abs(z1) < par.eps,path='analytic')
+
+        # b. fallback, its own result so nothing stale from an earlier solve is returned
+        sol = self.find_equilibrium(p1_guess,do_print=False)
+        return SimpleNamespace(p1=sol.p1,z1=sol.z1,z2=sol.z2,converged=sol.converged,path='numeric')
 
-        for p1 in price_range:
-            eps1, eps2 = self.check_market_clearing(p1)
-            excess_demand = np.abs(eps1) + np.abs(eps2)  # Total excess demand
+    def solve_best_choice_any_price(self,method='auto'):
+        """A sets p1 to maximize own utility given B's demand (question 4.b)
 
-            if excess_demand < min_excess_demand:
-                min_excess_demand = excess_demand
-                best_price = p1
+        In the Cobb-Douglas case the first-order condition is a quadratic in p1
+        with exactly one positive root."""
+        par = self.par
+        use_analytic = self._check_method(method)
+
+        if use_analytic:
+
+            # a. B's demand is x1B = a + b/p1, x2B = d + c*p1
+            a = par.beta*(1-par.w1A)
+            b = par.beta*(1-par.w2A)
+            c = (1-par.beta)*(1-par.w1A)
+            d = (1-par.beta)*(1-par.w2A)
+
+            # b. positive root of the first-order condition
+            q2 = (1-par.alpha)*c*(1-a)
+            q1 = b*c*(2*par.alpha-1)
+            q0 = -par.alpha*b*(1-d)
+            if not (np.all(q2 > 0) and np.all(q0 < 0)):
+                use_analytic = self._no_closed_form(method,'the first-order condition has no single positive root')
+
+        if use_analytic:
+            p1 = (-q1 + np.sqrt(q1**2 - 4*q2*q0)) / (2*q2)
+            x1A = 1 - a - b/p1
+            x2A = 1 - d - c*p1
+            if not (np.all(x1A > 0) and np.all(x2A > 0)):
+                use_analytic = self._no_closed_form(method,'the optimum is not interior')
+
+        if use_analytic:
+            path = 'analytic'
+        else:
+            x1A, x2A, uA, p1 = self.find_best_choice_any_price()
+            path = 'numeric'
+
+        return SimpleNamespace(x1A=x1A,x2A=x2A,uA=self.utility_A(x1A,x2A),p1=p1,path=path)
+
+    def solve_opgave_5_B(self,method='auto'):
+        """A chooses any allocation B accepts (question 5.b)
+
+        The optimum lies on the contract curve x2A = k*x1A/(1-x1A+k*x1A) where B is
+        exactly as well off as at the endowment. For alpha == beta this is solved in
+        closed form ('analytic'), otherwise by a root along the curve
+        ('contract_curve'). Both broadcast over a parameter grid; the root is
+        found by bisection on all grid points at once."""
+        par = self.par
+        use_analytic = self._check_method(method)
+
+        if use_analytic:
+            u_B_initial = self.utility_B(1-par.w1A,1-par.w2A)
+            k = par.beta*(1-par.alpha) / (par.alpha*(1-par.beta))
+
+            # a. u_B along the contract curve as a function of s = x1B, negative at 0 and positive at 1
+            def gap(s):
+                return s - u_B_initial*(s + k*(1-s))**(1-par.beta)
+
+            if np.all(k == 1):
+                x1B = u_B_initial
+                path = 'analytic'
+            else:
+                lo = np.zeros(np.shape(k))
+                hi = np.ones(np.shape(k))
+                while np.any(hi - lo > par.eps):
+                    mid = (lo + hi)/2
+                    below = gap(mid) < 0
+                    lo = np.where(below, mid, lo)
+                    hi = np.where(below, hi, mid)
+                x1B = np.where(k == 1, u_B_initial, (lo + hi)/2)
+                x1B = x1B if np.ndim(x1B) > 0 else float(x1B)
+                path = 'contract_curve'
+
+            # b. allocation of A
+            x1A = 1 - x1B
+            x2A = k*x1A / (1 - x1A + k*x1A)
+            u_A_opt = self.utility_A(x1A,x2A)
+
+        else:
+            u_A_opt, x1A, x2A = self.opgave_5_B_solver()
+            path = 'numeric'
+
+        return SimpleNamespace(u_A=u_A_opt,x1A=x1A,x2A=x2A,path=path)
+
+class PopulationExchangeEconomyClass:
+    """exchange economy with many Cobb-Douglas consumers and p2 = 1
+
+    alpha, w1 and w2 hold one entry per consumer along the last axis. Leading
+    axes index independent economies, e.g. shape (S,N) for S economies with N
+    consumers each, which are all solved at once."""
+
+    def __init__(self,alpha,w1,w2):
+
+        par = self.par = SimpleNamespace()
+
+        # a. preferences and endowments (contiguous float arrays)
+        par.alpha = np.ascontiguousarray(alpha,dtype=float)
+        par.w1 = np.ascontiguousarray(w1,dtype=float)
+        par.w2 = np.ascontiguousarray(w2,dtype=float)
+
+        # b. total endowments
+        par.w1bar = par.w1.sum(axis=-1)
+        par.w2bar = par.w2.sum(axis=-1)
+
+        # c. div
+        par.eps = 1e-8 # tolerance relative to total endowment of good 1
+        par.maxiter = 100 # iter
+
+    def demand(self,p1):
+        par = self.par
+        p1 = np.asarray(p1,dtype=float)[...,np.newaxis]
+        income = p1*par.w1 + par.w2
+        x1 = par.alpha * income / p1
+        x2 = (1-par.alpha) * income
+        return x1, x2
+
+    def excess_demand(self,p1):
+        """aggregate excess demand for good 1 and 2 and the derivative of the former"""
+        par = self.par
+        p1 = np.asarray(p1,dtype=float)
+
+        # a. sums over consumers
+        alpha_w1 = np.einsum('...i,...i->...',par.alpha,par.w1)
+        alpha_w2 = np.einsum('...i,...i->...',par.alpha,par.w2)
+
+        # b. excess demand and slope
+        z1 = alpha_w1 + alpha_w2/p1 - par.w1bar
+        z2 = (par.w1bar-alpha_w1)*p1 + (par.w2bar-alpha_w2) - par.w2bar
+        dz1 = -alpha_w2/p1**2
+
+        return z1, z2, dz1
+
+    def find_equilibrium(self,p1_guess=1.0,do_print=False):
+        """market clearing p1 by Newton steps safeguarded by a bisection bracket"""
+        par = self.par
 
-        return best_price, min_excess_demand
\ No newline at end of file
+        # a. aggregate once, demand is linear in the income terms
+        alpha_w1 = np.einsum('...i,...i->...',par.alpha,par.w1)
+        alpha_w2 = np.einsum('...i,...i->...',par.alpha,par.w2)
+
+        def z1_fun(p1):
+            return alpha_w1 + alpha_w2/p1 - par.w1bar
+
+        # b. bracket: z1 is decreasing in p1
+        p1 = np.broadcast_to(np.asarray(p1_guess,dtype=float),par.w1bar.shape).copy()
+        lo = p1.copy()
+        hi = p1.copy()
+        for _ in range(par.maxiter):
+            move = z1_fun(lo) < 0
+            if not move.any(): break
+            lo[move] /= 2
+        for _ in range(par.maxiter):
+            move = z1_fun(hi) > 0
+            if not move.any(): break
+            hi[move] *= 2
+
+        # c. safeguarded Newton (t and converged are set even if maxiter is 0)
+        tol = par.eps*par.w1bar
+        t = 0
+        converged = np.abs(z1_fun(p1)) < tol
+        for t in range(par.maxiter):
+
+            z1 = z1_fun(p1)
+            converged = np.abs(z1) < tol
+            if do_print:
+                print(f'{t:3d}: max abs exess demand -> {np.max(np.abs(z1)):14.8e}')
+            if converged.all(): break
+
+            # i. shrink bracket
+            lo = np.where(z1 > 0, p1, lo)
+            hi = np.where(z1 < 0, p1, hi)
+
+            # ii. Newton step, bisect if it leaves the bracket
+            p1_new = p1 + z1*p1**2/alpha_w2
+            outside = ~((p1_new > lo) & (p1_new < hi))
+            p1 = np.where(converged, p1, np.where(outside, (lo+hi)/2, p1_new))
+
+        if do_print and not converged.all():
+            print(f'solution was not found for {np.sum(~converged)} economies')
+
+        # d. store solution
+        z1, z2, _ = self.excess_demand(p1)
+        self.sol = SimpleNamespace(p1=p1,z1=z1,z2=z2,converged=converged,iterations=t)
+        return self.sol
+
+
+# monte carlo over random endowments
+ENDOWMENT_SWEEP_FIELDS = ('w1A','w2A','p1','x1A_eq','x2A_eq','u_A_5','x1A_5','x2A_5','x1A_6','x2A_6')
+
+def _endowment_chunk(seed_seq,size,alpha,beta,grid_N):
+    """solve one chunk of endowment draws with its own random stream"""
+
+    # a. draws
+    rng = np.random.default_rng(seed_seq)
+    w = rng.uniform(size=(size,2))
+
+    # b. one economy reused for all draws in the chunk
+    economy = ExchangeEconomyClass()
+    par = economy.par
+    par.alpha = alpha
+    par.beta = beta
+
+    out = {field: np.empty(size) for field in ENDOWMENT_SWEEP_FIELDS}
+    out['w1A'][:] = w[:,0]
+    out['w2A'][:] = w[:,1]
+
+    # c. solve
+    for i in range(size):
+        par.w1A, par.w2A = w[i]
+
+        eq = economy.solve_equilibrium()
+        out['p1'][i] = eq.p1
+        out['x1A_eq'][i], out['x2A_eq'][i] = economy.demand_A(eq.p1)
+
+        sol5 = economy.solve_opgave_5_B()
+        out['u_A_5'][i], out['x1A_5'][i], out['x2A_5'][i] = sol5.u_A, sol5.x1A, sol5.x2A
+
+        _, out['x1A_6'][i], out['x2A_6'][i] = economy.grid_search(grid_N,objective='social')
+
+    return out
+
+def endowment_sweep(n_draws,seed=2024,n_workers=None,chunk_size=1000,alpha=1/3,beta=2/3,grid_N=76):
+    """equilibria and question 5/6 allocations for n_draws uniform endowments
+
+    Draws are split into chunks of chunk_size, each with its own child of
+    SeedSequence(seed), so results are identical for any n_workers. Chunks run
+    in a process pool (n_workers=1 runs in-process) and are written into
+    preallocated arrays. grid_N is the grid size used for question 6."""
+
+    # a. chunks and their random streams
+    starts = list(range(0,n_draws,chunk_size))
+    sizes = [min(chunk_size,n_draws-start) for start in starts]
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+    # b. preallocate results
+    res = SimpleNamespace(**{field: np.empty(n_draws) for field in ENDOWMENT_SWEEP_FIELDS})
+
+    def store(start,out):
+        for field in ENDOWMENT_SWEEP_FIELDS:
+            getattr(res,field)[start:start+len(out[field])] = out[field]
+
+    # c. solve
+    if n_workers == 1:
+        for start, size, seed_seq in zip(starts,sizes,seeds):
+            store(start,_endowment_chunk(seed_seq,size,alpha,beta,grid_N))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(_endowment_chunk,seed_seq,size,alpha,beta,grid_N): start
+                       for start, size, seed_seq in zip(starts,sizes,seeds)}
+            for future in as_completed(futures):
+                store(futures[future],future.result())
+
+    return res
@@ -1,9 +1,12 @@
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from scipy import optimize
-import sympy as sm
 import numpy as np
 
   
 def define_symbols():
+    import sympy as sm  # imported here so the numerical classes load without sympy
     # defining the symbols of the pricipal-agent model
     L = sm.symbols('L')
     M = sm.symbols('M')
@@ -16,6 +19,7 @@ def define_symbols():
     return L, M, pi, c_1, c_2, lam, v_overline, v
 
 def calculate_derivatives(L, M, pi, c_1, c_2, lam, v_overline, v):
+    import sympy as sm
     # We define v differentiated with respect to respectively c_1 and c_2
     v_diff_c1 = sm.diff(v(c_1), c_1)
     v_diff_c2 = sm.diff(v(c_2), c_2)
@@ -33,19 +37,144 @@ def calculate_derivatives(L, M, pi, c_1, c_2, lam, v_overline, v):
     return principal, condition, lagrange, Lc_1, Lc_2, Llam, v_diff_c1, v_diff_c2
 
 def solve_equations(Lc_1, Lc_2, Llam, v_diff_c1, v_diff_c2):
+    import sympy as sm
     # solve for v_diff_c1 and v_diff_c2 
     solution = sm.solve([Lc_1, Lc_2, Llam], (v_diff_c1, v_diff_c2))
     return solution 
 
+@lru_cache(maxsize=None)
+def compile_foc():
+    import sympy as sm
+    # lambdify the first-order conditions of the Lagrangian and their Jacobian once
+    L, M, pi, c_1, c_2, lam, v_overline, v = define_symbols()
+    principal, condition, lagrange, Lc_1, Lc_2, Llam, v_diff_c1, v_diff_c2 = calculate_derivatives(L, M, pi, c_1, c_2, lam, v_overline, v)
+
+    # agent utility v(c) = c**(1-rho)/(1-rho) and the outside option
+    rho = sm.symbols('rho')
+    c = sm.symbols('c')
+    v_agent = sm.Lambda(c, c**(1 - rho) / (1 - rho))
+    lagrange = lagrange.subs(v_overline, pi * v(M - L) + (1 - pi) * v(M)).subs(v, v_agent).doit()
+
+    # conditions and their exact Jacobian in (c_1, c_2, lambda)
+    unknowns = [c_1, c_2, lam]
+    foc = sm.Matrix([sm.diff(lagrange, x) for x in unknowns])
+    jac = foc.jacobian(unknowns)
+
+    args = (c_1, c_2, lam, M, L, pi, rho)
+    return sm.lambdify(args, list(foc), 'numpy'), sm.lambdify(args, jac.tolist(), 'numpy')
+
+def solve_foc(M, L, pi, rho, tol=1e-12, maxiter=50):
+    # solve the compiled first-order conditions by batched Newton steps, all inputs may be arrays
+    foc, jac = compile_foc()
+    M, L, pi, rho = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (M, L, pi, rho)))
+
+    # start from expected wealth with full insurance, lambda = 1/v'(c)
+    c_1 = M - pi * L
+    c_2 = c_1.copy()
+    lam = c_1**rho
+
+    def evaluate(c_1, c_2, lam):
+        F = np.stack(np.broadcast_arrays(*foc(c_1, c_2, lam, M, L, pi, rho)), axis=-1)
+        J = np.stack([np.stack(np.broadcast_arrays(*row), axis=-1) for row in jac(c_1, c_2, lam, M, L, pi, rho)], axis=-2)
+        return F, J
+
+    F, J = evaluate(c_1, c_2, lam)
+    for it in range(maxiter):
+        converged = np.max(np.abs(F), axis=-1) < tol
+        if np.all(converged):
+            break
+
+        # Newton step, halved while consumption would turn negative
+        step = np.linalg.solve(J, -F[..., np.newaxis])[..., 0]
+        step = np.where(converged[..., np.newaxis], 0.0, step)
+        size = np.ones(c_1.shape)
+        for _ in range(30):
+            positive = (c_1 + size * step[..., 0] > 0) & (c_2 + size * step[..., 1] > 0)
+            if np.all(positive):
+                break
+            size = np.where(positive, size, size / 2)
+        c_1, c_2, lam = c_1 + size * step[..., 0], c_2 + size * step[..., 1], lam + size * step[..., 2]
+        F, J = evaluate(c_1, c_2, lam)
+
+    converged = np.max(np.abs(F), axis=-1) < tol
+    return SimpleNamespace(c1=c_1, c2=c_2, lam=lam, K=c_2 - c_1 + L, gamma=M - c_1, converged=converged, iterations=it)
+
+class ParameterSet(SimpleNamespace):
+    """model parameters, each a scalar or a broadcastable numpy array
+
+    replace() and grid() return modified copies and never change the original,
+    so one set of parameters can be shared safely between model instances.
+
+    Each project folder is imported on its own from its notebook, so the same
+    class is also defined in inauguralproject/inauguralproject.py and
+    examproject/problem1.py; keep the three copies identical."""
+
+    def replace(self,**kwargs):
+        """copy with the given entries replaced"""
+        new = ParameterSet(**vars(self))
+        for key, value in kwargs.items():
+            setattr(new,key,value)
+        return new
+
+    def grid(self,**kwargs):
+        """copy where each given array gets its own axis, e.g. grid(tau=taus,T=Ts) has shape (len(taus),len(Ts))"""
+        new = ParameterSet(**vars(self))
+        n = len(kwargs)
+        for i, (key, value) in enumerate(kwargs.items()):
+            shape = [1]*n
+            shape[i] = -1
+            setattr(new,key,np.asarray(value,dtype=float).reshape(shape))
+        return new
+
+    @property
+    def shape(self):
+        """broadcast shape of all array entries"""
+        return np.broadcast_shapes(*(value.shape for value in vars(self).values() if isinstance(value,np.ndarray)))
+
+def inverse_utility(u, rho):
+    # consumption giving utility u for the agent utility c**(1 - rho) / (1 - rho)
+    return ((1 - rho) * u)**(1 / (1 - rho))
+
+def _slsqp_path(model, values, guess=None):
+    # SLSQP along a path of pi (or e) values, each solve warm-started from the previous solution
+    K = np.full(len(values), np.nan)
+    gamma = np.full(len(values), np.nan)
+    success = np.zeros(len(values), dtype=bool)
+    for k, (value, par) in enumerate(values):
+        model.par = par
+        K_k, gamma_k, success[k] = model.optimize_for(value, guess)
+        if success[k]:
+            K[k], gamma[k] = K_k, gamma_k
+            guess = [K_k, gamma_k]
+    return K, gamma, success
+
+def _solve_fallback(model, values, n_workers=1):
+    # SLSQP for the rows where no KKT solution applies, in n_workers continuation chains
+    if n_workers == 1 or len(values) < 2:
+        return _slsqp_path(model, values)
+    chains = np.array_split(np.arange(len(values)), n_workers)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(_slsqp_path, model, [values[k] for k in chain]) for chain in chains]
+        parts = [future.result() for future in futures]
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
 class numerical_solution:
     
     def __init__(self):
         self.results = []
+        self.par = ParameterSet(M=50, L=5, rho=0.3)
+
+    def with_par(self, **kwargs):
+        # new instance with some parameters replaced, this one is left unchanged
+        model = type(self)()
+        model.par = self.par.replace(**kwargs)
+        return model
 
     def parameter(self, K, gamma, pi):
-        M = 50
-        L = 5
-        rho = 0.3
+        par = self.par
+        M = par.M
+        L = par.L
+        rho = par.rho
 
         # Compute consumptions
         c1 = M - gamma
@@ -66,8 +195,9 @@ class numerical_solution:
         M, L, pi, rho, c1, c2 = self.parameter(K, gamma, pi)
         return pi * self.agent_utility(c2, rho) + (1 - pi) * self.agent_utility(c1, rho) - (pi * self.agent_utility(M - L, rho) + (1 - pi) * self.agent_utility(M, rho))
 
-    def optimize_for_pi(self, pi_value):
-        initial_guess_K_gamma = [2, 2]  # Initial guess for K and gamma
+    def optimize_for_pi(self, pi_value, initial_guess_K_gamma=None):
+        if initial_guess_K_gamma is None:
+            initial_guess_K_gamma = [2, 2]  # Initial guess for K and gamma
 
         # Define bounds for K and gamma
         bounds = [(0, None), (0, None)]  # K >= 0, gamma >= 0
@@ -81,13 +211,48 @@ class numerical_solution:
         K, gamma = result.x
         return K, gamma, result.success
 
+    optimize_for = optimize_for_pi
+
+    def solve_contracts(self, pi_values, n_workers=1, method='kkt'):
+        # optimal contracts for all pi values (and arrays in par) at once
+        # method='kkt' uses the closed form, method='foc' Newton on the compiled sympy conditions
+        par = self.par
+        pi, M, L, rho = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (pi_values, par.M, par.L, par.rho)))
+
+        if method == 'kkt':
+            # KKT: u'(c1) = u'(c2) gives full insurance K = L, the participation constraint binds
+            u0 = pi * self.agent_utility(M - L, rho) + (1 - pi) * self.agent_utility(M, rho)
+            with np.errstate(invalid='ignore'):
+                gamma = M - inverse_utility(u0, rho)
+            K = L.copy()
+            valid = np.ones(pi.shape, dtype=bool)
+        elif method == 'foc':
+            foc = solve_foc(M, L, pi, rho)
+            K, gamma, valid = foc.K, foc.gamma, foc.converged & (foc.lam >= 0)
+        else:
+            raise ValueError(f'unknown method: {method}')
+        kkt = valid & np.isfinite(gamma) & (gamma >= 0) & (K >= 0)
+
+        sol = SimpleNamespace(pi=pi, K=np.where(kkt, K, np.nan), gamma=np.where(kkt, gamma, np.nan), success=kkt.copy(),
+                              path=np.where(kkt, method, 'slsqp'))
+
+        # SLSQP with continuation where the KKT solution does not apply
+        rows = list(zip(*np.nonzero(~kkt)))
+        if rows:
+            values = [(pi[row], self.par.replace(M=M[row], L=L[row], rho=rho[row])) for row in rows]
+            K_fb, gamma_fb, success_fb = _solve_fallback(self.with_par(), values, n_workers)
+            for k, row in enumerate(rows):
+                sol.K[row], sol.gamma[row], sol.success[row] = K_fb[k], gamma_fb[k], success_fb[k]
+
+        return sol
+
     def run_optimization(self):
         # Define a range of possible values for pi
         pi_values = np.linspace(0.1, 0.9, 9)  # e.g., 9 values from 0.1 to 0.9
 
-        # Loop over all pi values and store results
-        for pi_val in pi_values:
-            K, gamma, success = self.optimize_for_pi(pi_val)
+        # Solve all pi values at once and store results
+        sol = self.solve_contracts(pi_values)
+        for pi_val, K, gamma, success in zip(pi_values, sol.K, sol.gamma, sol.success):
             if success:
                 self.results.append((pi_val, K, gamma))
             else:
@@ -112,13 +277,21 @@ class further_analysis:
         self.e_values = []
         self.K_values = []
         self.gamma_values = []
+        self.par = ParameterSet(M=50, L=5, rho=0.3, pi=0.1, pi_s=0.5)
+
+    def with_par(self, **kwargs):
+        # new instance with some parameters replaced, this one is left unchanged
+        model = type(self)()
+        model.par = self.par.replace(**kwargs)
+        return model
 
     def parameter(self, K, gamma, e):
-        M = 50
-        L = 5
-        rho = 0.3
-        pi = 0.1
-        pi_s = 0.5
+        par = self.par
+        M = par.M
+        L = par.L
+        rho = par.rho
+        pi = par.pi
+        pi_s = par.pi_s
 
         # Compute consumptions
         c1 = M - gamma
@@ -144,8 +317,9 @@ class further_analysis:
         M, L, e, rho, c1, c2, pi, pi_s = self.parameter(K, gamma, e)
         return (pi_s - pi)*(self.agent_utility(c1, rho)-self.agent_utility(c2, rho)) - e
 
-    def optimize_for_e(self, e_value):
-        initial_guess_K_gamma = [2, 2]  # Initial guess for K and gamma
+    def optimize_for_e(self, e_value, initial_guess_K_gamma=None):
+        if initial_guess_K_gamma is None:
+            initial_guess_K_gamma = [2, 2]  # Initial guess for K and gamma
 
         # Define bounds for K and gamma
         bounds = [(0, None), (0, None)]  # K >= 0, gamma >= 0
@@ -159,13 +333,50 @@ class further_analysis:
         K, gamma = result.x
         return K, gamma, result.success
 
+    optimize_for = optimize_for_e
+
+    def solve_contracts(self, e_values, n_workers=1):
+        # optimal contracts for all e values (and arrays in par) at once
+        par = self.par
+        e, M, L, rho, pi, pi_s = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (e_values, par.M, par.L, par.rho, par.pi, par.pi_s)))
+
+        # KKT: participation and incentive constraints both bind
+        u0 = pi * self.agent_utility(M - L, rho) + (1 - pi) * self.agent_utility(M, rho)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            u_gap = e / (pi_s - pi)
+            u1 = u0 + e + pi * u_gap
+            c1 = inverse_utility(u1, rho)
+            c2 = inverse_utility(u1 - u_gap, rho)
+        gamma = M - c1
+        K = c2 - c1 + L
+
+        # multiplier on the incentive constraint must be non-negative
+        with np.errstate(invalid='ignore', divide='ignore'):
+            du1, du2 = c1**(-rho), c2**(-rho)
+            lam = (1 - pi) / du1 + pi / du2
+            mu = (1 - pi) * (1 / du1 - lam) / (pi_s - pi)
+        kkt = np.isfinite(K) & np.isfinite(gamma) & (K >= 0) & (gamma >= 0) & (pi_s > pi) & (mu >= 0)
+
+        sol = SimpleNamespace(e=e, K=np.where(kkt, K, np.nan), gamma=np.where(kkt, gamma, np.nan), success=kkt.copy(),
+                              path=np.where(kkt, 'kkt', 'slsqp'))
+
+        # SLSQP with continuation where the KKT solution does not apply
+        rows = list(zip(*np.nonzero(~kkt)))
+        if rows:
+            values = [(e[row], self.par.replace(M=M[row], L=L[row], rho=rho[row], pi=pi[row], pi_s=pi_s[row])) for row in rows]
+            K_fb, gamma_fb, success_fb = _solve_fallback(self.with_par(), values, n_workers)
+            for k, row in enumerate(rows):
+                sol.K[row], sol.gamma[row], sol.success[row] = K_fb[k], gamma_fb[k], success_fb[k]
+
+        return sol
+
     def run_optimization(self):
         # Define a range of possible values for e
         e_values = np.linspace(0.01, 0.092, 30)  # e.g., 30 values from 0.01 to 0.1
 
-        # Loop over all e values and store results
-        for e_val in e_values:
-            K, gamma, success = self.optimize_for_e(e_val)
+        # Solve all e values at once and store results
+        sol = self.solve_contracts(e_values)
+        for e_val, K, gamma, success in zip(e_values, sol.K, sol.gamma, sol.success):
             if success:
                 self.results.append((e_val, K, gamma))
                 self.e_values.append(e_val)